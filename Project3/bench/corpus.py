@@ -0,0 +1,90 @@
+"""
+Synthetic corpus generator for the indexing and query benchmarks.
+
+Documents are cleaned-looking strings of lowercase words drawn from a Zipf distribution over a fixed vocabulary, so
+term frequencies and document frequencies have the long tail of real text. Everything is seeded, so the same
+arguments always produce the same corpus and queries.
+"""
+
+import numpy as np
+
+# number of distinct words in the synthetic vocabulary
+VOCAB_SIZE = 20000
+# the most frequent words behave like stop words and are never used in queries
+QUERY_SKIP = 50
+
+SYLLABLES = [c + v for c in 'bcdfghklmnprstvz' for v in 'aeiou']
+
+def word(i):
+    """
+    Return the i-th word of the vocabulary, a string of two or more syllables unique to i.
+
+    @param i: word number.
+    @return lowercase word.
+    """
+    parts = [SYLLABLES[i % len(SYLLABLES)]]
+    i //= len(SYLLABLES)
+    while True:
+        parts.append(SYLLABLES[i % len(SYLLABLES)])
+        i //= len(SYLLABLES)
+        if i == 0:
+            return ''.join(parts)
+
+def vocabulary(size=VOCAB_SIZE):
+    """
+    Return the vocabulary and the Zipf probability of each of its words, most frequent first.
+
+    @param size: number of words.
+    @return tuple of (list of words, numpy array of probabilities).
+    """
+    weights = 1.0 / np.arange(1, size + 1)
+    return [word(i) for i in range(size)], weights / weights.sum()
+
+def make_corpus(n, vocab_size=VOCAB_SIZE, min_words=20, max_words=200, seed=0, batch=1000, duplicates=0.0):
+    """
+    Generate n synthetic documents one at a time, without holding the corpus in memory.
+
+    @param n: number of documents. vocab_size: number of distinct words. min_words, max_words: range of document lengths.
+           seed: random seed. batch: number of documents whose words are drawn from numpy at once.
+           duplicates: fraction of documents that are near-copies of an earlier document in the same batch, with one
+           word in a hundred replaced, like a print view or a url variant of the same page.
+    @return generator of (url, document) tuples.
+    """
+    rng = np.random.default_rng(seed)
+    words, p = vocabulary(vocab_size)
+    words = np.array(words, dtype=object)
+
+    for first in range(0, n, batch):
+        count = min(batch, n - first)
+        lengths = rng.integers(min_words, max_words + 1, count)
+        drawn = words[rng.choice(vocab_size, int(lengths.sum()), p=p)]
+
+        copies = rng.random(count) < duplicates
+        docs = []
+        start = 0
+        for i in range(count):
+            if copies[i] and i > 0:
+                copy = docs[rng.integers(i)].split()
+                for j in rng.integers(len(copy), size=len(copy) // 100):
+                    copy[j] = copy[rng.integers(len(copy))]
+                docs.append(' '.join(copy))
+            else:
+                docs.append(' '.join(drawn[start:start + lengths[i]]))
+            start += lengths[i]
+            yield 'https://bench.utk.edu/doc/' + str(first + i), docs[i]
+
+def make_queries(n, vocab_size=VOCAB_SIZE, max_words=3, seed=1):
+    """
+    Generate n queries of one to max_words words, drawn from the same distribution as the documents minus the stop words.
+
+    @param n: number of queries. vocab_size: number of distinct words. max_words: longest query. seed: random seed.
+    @return list of query strings.
+    """
+    rng = np.random.default_rng(seed)
+    words, p = vocabulary(vocab_size)
+    p = p[QUERY_SKIP:] / p[QUERY_SKIP:].sum()
+
+    queries = []
+    for length in rng.integers(1, max_words + 1, n):
+        queries.append(' '.join(words[QUERY_SKIP + i] for i in rng.choice(len(p), length, p=p)))
+    return queries
@@ -0,0 +1,210 @@
+"""
+Local HTTP fixture site for the crawl benchmark.
+
+Serves a generated site of a given number of pages, linked as a tree of a given depth from the root page, with an
+optional delay before every response to imitate network latency. Pages use the layout WebCrawler expects: text in
+<p> elements of 'entry-content' and 'person_content' divs and <td> elements of 'table_default' tables, next to text
+in other elements that must not be extracted, links back to the root and parent pages that must not be collected
+twice, links outside the site that must not be collected at all, and some links to missing pages.
+
+To serve a site by itself, run 'python3 fixture_site.py -pages <pages> -depth <depth> -latency <seconds> -port <port>'.
+"""
+
+import time
+import random
+import argparse
+import threading
+from itertools import accumulate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from corpus import vocabulary
+
+# pages numbered by a multiple of these also have a person_content div, a table_default table, and a missing link
+PERSON_EVERY = 5
+TABLE_EVERY = 3
+MISSING_EVERY = 10
+
+class FixtureServer(ThreadingHTTPServer):
+    # a crawler opens many connections at once, more than the default backlog of 5
+    request_queue_size = 128
+    daemon_threads = True
+
+class FixtureSite:
+    """
+    Generated site served from a background thread on 127.0.0.1.
+
+    Page i is served at /page/<i>.html and links to pages i * b + 1 through i * b + b, where the branching factor b is
+    the smallest one that fits every page within depth levels below the root. Page contents are generated from a seed
+    when they are requested, so any number of pages costs no memory.
+    """
+
+    def __init__(self, pages=500, depth=3, latency=0.0, port=0, seed=0):
+        """
+        Constructor that saves the shape of the site.
+
+        @param pages: number of pages. depth: number of levels of links below the root page. latency: seconds to wait
+               before every response. port: port to listen on, any free port if 0. seed: random seed of the page text.
+        @return N/A
+        """
+        self.pages = pages
+        self.depth = depth
+        self.latency = latency
+        self.port = port
+        self.seed = seed
+        self.words, p = vocabulary()
+        self.cum_weights = list(accumulate(p))
+
+        self.branching = 1
+        while depth > 0 and sum(self.branching ** d for d in range(depth + 1)) < pages:
+            self.branching += 1
+
+    def start(self):
+        """
+        Start serving in a background thread.
+
+        @param N/A
+        @return url of the root page.
+        """
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                site.respond(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = FixtureServer(('127.0.0.1', self.port), Handler)
+        self.port = self.server.server_address[1]
+
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url(0)
+
+    def stop(self):
+        """
+        Stop serving and close the listening socket.
+
+        @param N/A
+        @return N/A
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+    def host(self):
+        """
+        Return the host and port of the site, the domain a WebCrawler must be restricted to.
+
+        @param N/A
+        @return string such as '127.0.0.1:8765'.
+        """
+        return '127.0.0.1:' + str(self.port)
+
+    def url(self, i):
+        """
+        Return the url of page i.
+
+        @param i: page number.
+        @return absolute url.
+        """
+        return 'http://' + self.host() + '/page/' + str(i) + '.html'
+
+    def children(self, i):
+        """
+        Return the page numbers page i links to.
+
+        @param i: page number.
+        @return range of page numbers.
+        """
+        first = i * self.branching + 1
+        return range(min(first, self.pages), min(first + self.branching, self.pages))
+
+    def respond(self, handler):
+        """
+        Answer one request with the page it asks for, or 404.
+
+        @param handler: BaseHTTPRequestHandler of the request.
+        @return N/A
+        """
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        page = None
+        if handler.path.startswith('/page/') and handler.path.endswith('.html'):
+            number = handler.path[len('/page/'):-len('.html')]
+            if number.isdigit() and int(number) < self.pages:
+                page = self.render(int(number))
+
+        if page is None:
+            handler.send_error(404)
+            return
+
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/html; charset=utf-8')
+        handler.send_header('Content-Length', str(len(page)))
+        handler.end_headers()
+        handler.wfile.write(page)
+
+    def render(self, i):
+        """
+        Generate the HTML of page i.
+
+        @param i: page number.
+        @return utf-8 encoded page.
+        """
+        r = random.Random(self.seed * 1000003 + i)
+
+        def text(n):
+            return ' '.join(r.choices(self.words, cum_weights=self.cum_weights, k=n)).capitalize() + '.'
+
+        html = ['<html><head><title>Page ' + str(i) + '</title></head><body>',
+                '<nav><a href="' + self.url(0) + '">Home</a> <a href="' + self.url((i - 1) // self.branching if i > 0 else 0) + '">Up</a> '
+                '<a href="https://www.example.com/">Elsewhere</a></nav>',
+                '<div class="sidebar"><p>' + text(10) + '</p></div>',
+                '<div class="entry-content">']
+        for j in range(3):
+            html.append('<p>' + text(r.randint(20, 60)) + '</p>')
+        html.append('</div>')
+
+        if i % PERSON_EVERY == 0:
+            html.append('<div class="person_content"><p>' + text(30) + '</p></div>')
+
+        if i % TABLE_EVERY == 0:
+            html.append('<table class="table_default"><tr><td>' + text(8) + '</td><td>' + text(8) + '</td></tr></table>')
+
+        html.append('<ul>')
+        for child in self.children(i):
+            html.append('<li><a href="' + self.url(child) + '">' + text(3) + '</a></li>')
+        if i % MISSING_EVERY == MISSING_EVERY - 1:
+            html.append('<li><a href="http://' + self.host() + '/missing/' + str(i) + '.html">Missing</a></li>')
+        html.append('</ul></body></html>')
+
+        return '\n'.join(html).encode('utf-8')
+
+def main():
+    """
+    Parse arguments and serve a fixture site until the process is interrupted.
+
+    @param N/A
+    @return N/A
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-pages', type=int, default=500)
+    parser.add_argument('-depth', type=int, default=3)
+    parser.add_argument('-latency', type=float, default=0.0)
+    parser.add_argument('-port', type=int, default=8765)
+
+    args = parser.parse_args()
+
+    site = FixtureSite(args.pages, args.depth, args.latency, args.port)
+    print('fixture_site(): SERVING ' + str(args.pages) + ' PAGES ON ' + site.start())
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        site.stop()
+
+if __name__ == '__main__':
+    main()
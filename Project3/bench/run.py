@@ -0,0 +1,266 @@
+"""
+Offline benchmark suite for the crawler, the index, and queries.
+
+The crawl benchmark crawls a FixtureSite on localhost through the same CrawlPipeline training uses and reports pages
+per second. The index benchmark builds an IncrementalIndex from a synthetic corpus of each requested size, in a fresh
+process so peak memory is measured per size, and reports the build time, peak resident memory, saved index size,
+p50/p99 query latency of both the in-memory index and the saved index opened as a MappedIndex, and how many of the
+in-memory index's top 5 results the saved index also returns, since the saved index stores quantized weights.
+
+Results are compared against the baseline file, and the run fails if any result is worse than its baseline by more
+than the tolerance. No baseline is shipped, since the numbers depend on the machine; record one with -save-baseline.
+Without a baseline file the run fails before benchmarking anything, unless -save-baseline is given.
+
+From this directory run:
+'python3 run.py -sizes <sizes> -pages <pages> -depth <depth> -latency <seconds> -queries <queries> -duplicates <fraction>
+-baseline <file> -tolerance <fraction>'
+<sizes> is a comma separated list of corpus sizes, 10000,100000,1000000 by default; the largest needs about 8 GB of memory.
+Add -save-baseline to record the results as the new baseline, and -skip-crawl to only run the index benchmark.
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import multiprocessing
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from corpus import make_corpus, make_queries
+from fixture_site import FixtureSite
+
+DEFAULT_SIZES = '10000,100000,1000000'
+BASELINE = os.path.join(HERE, 'baseline.json')
+# results where larger is better; smaller is better for all the others
+HIGHER_IS_BETTER = {'pages_per_second', 'top5_agreement'}
+# results that describe what was measured rather than how fast it was; a section is only compared against the
+# baseline when these match, since timings of a different site or corpus size are not comparable
+SHAPE = {'pages', 'documents', 'aliases', 'queries', 'fetch_errors'}
+
+def bench_crawl(pages, depth, latency):
+    """
+    Crawl a fixture site with a WebCrawler and a CrawlPipeline, collecting links while pages are crawled like train() does.
+
+    @param pages: number of pages in the site. depth: levels of links below the root. latency: seconds the site waits per response.
+    @return dictionary of results.
+    """
+    from crawler import WebCrawler
+    from pipeline import CrawlPipeline
+
+    site = FixtureSite(pages, depth, latency)
+    root = site.start()
+
+    try:
+        crawler = WebCrawler(root, 'F', depth - 1, domain=site.host())
+        start = time.perf_counter()
+        documents = sum(1 for link, doc in CrawlPipeline(crawler).run(crawler.iter_collect(root, depth - 1)) if doc)
+        elapsed = time.perf_counter() - start
+    finally:
+        site.stop()
+
+    fetch = crawler.metrics.histograms[('fetch_seconds', ())]
+    parse = crawler.metrics.histograms[('parse_seconds', ())]
+    errors = sum(n for (name, labels), n in crawler.metrics.counters.items() if name == 'fetch_errors')
+
+    return {'pages': crawler.crawled, 'documents': documents, 'fetch_errors': errors, 'pages_per_second': crawler.crawled / elapsed,
+            'fetch_p50_ms': fetch.percentile(50) * 1000, 'fetch_p99_ms': fetch.percentile(99) * 1000,
+            'parse_p50_ms': parse.percentile(50) * 1000, 'parse_p99_ms': parse.percentile(99) * 1000}
+
+def bench_index(n, n_queries, duplicates, results):
+    """
+    Build an index of n synthetic documents, save it, and time queries against both copies. Runs in its own process.
+
+    @param n: number of documents. n_queries: number of queries to time. duplicates: fraction of near-duplicate documents.
+           results: multiprocessing queue the results are put on.
+    @return N/A
+    """
+    from engine import BATCH_SIZE
+    from index import IncrementalIndex, MappedIndex
+    from metrics import Metrics
+
+    metrics = Metrics()
+    index = IncrementalIndex()
+    build = 0.0
+
+    # only time indexing, not generating the corpus
+    urls = []
+    docs = []
+    for url, doc in make_corpus(n, duplicates=duplicates):
+        urls.append(url)
+        docs.append(doc)
+        if len(urls) == BATCH_SIZE:
+            start = time.perf_counter()
+            index.add_documents(urls, docs)
+            build += time.perf_counter() - start
+            urls = []
+            docs = []
+
+    start = time.perf_counter()
+    index.add_documents(urls, docs)
+    index.wait()
+    build += time.perf_counter() - start
+
+    queries = make_queries(n_queries)
+    expected = []
+    for query in queries:
+        with metrics.timer('memory_query_seconds'):
+            expected.append(index.search(query, 5))
+
+    path = tempfile.mkdtemp(prefix='bench-index-')
+    try:
+        start = time.perf_counter()
+        index.save(os.path.join(path, 'index'), 1)
+        save = time.perf_counter() - start
+
+        size = 0
+        for directory, subdirs, files in os.walk(path):
+            size += sum(os.path.getsize(os.path.join(directory, name)) for name in files)
+
+        mapped = MappedIndex(os.path.join(path, 'index'))
+        found = 0
+        for query, top in zip(queries, expected):
+            with metrics.timer('mapped_query_seconds'):
+                saved = mapped.search(query, 5)
+            found += len({link for link, score in top} & {link for link, score in saved})
+    finally:
+        shutil.rmtree(path)
+
+    memory = metrics.histograms[('memory_query_seconds', ())]
+    mapped = metrics.histograms[('mapped_query_seconds', ())]
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+
+    results.put({'documents': len(index), 'aliases': len(index.canonical), 'queries': len(queries), 'build_seconds': build, 'save_seconds': save,
+                 'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20, 'index_mb': size / 2 ** 20,
+                 'memory_query_p50_ms': memory.percentile(50) * 1000, 'memory_query_p99_ms': memory.percentile(99) * 1000,
+                 'mapped_query_p50_ms': mapped.percentile(50) * 1000, 'mapped_query_p99_ms': mapped.percentile(99) * 1000,
+                 'top5_agreement': found / max(1, sum(len(top) for top in expected))})
+
+def run_index(n, n_queries, duplicates):
+    """
+    Run bench_index() in a fresh process, so its peak memory is not inflated by earlier sizes.
+
+    @param n: number of documents. n_queries: number of queries to time. duplicates: fraction of near-duplicate documents.
+    @return dictionary of results.
+    """
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    worker = context.Process(target=bench_index, args=(n, n_queries, duplicates, results))
+    worker.start()
+
+    # a worker that crashed never puts its results, so stop waiting once it is gone
+    while True:
+        try:
+            result = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not worker.is_alive():
+                print('ERROR: index benchmark of ' + str(n) + ' documents failed')
+                exit(1)
+
+    worker.join()
+    return result
+
+def compare(results, baseline, tolerance):
+    """
+    Print every result next to its baseline and find the results that got worse by more than the tolerance.
+
+    @param results: results of this run. baseline: results of the baseline run, or None. tolerance: allowed fraction of slowdown.
+    @return list of names of the results that regressed.
+    """
+    regressions = []
+
+    for section, values in results.items():
+        if section == 'machine':
+            continue
+
+        old_values = (baseline or {}).get(section, {})
+        comparable = all(old_values.get(name) == value for name, value in values.items() if name in SHAPE)
+        if old_values and not comparable:
+            print(section + ': not compared, the baseline measured a different site or corpus')
+
+        for name, value in values.items():
+            line = section + '.' + name + ': ' + (str(value) if isinstance(value, int) else str('{:.3f}'.format(value)))
+            old = old_values.get(name)
+
+            if comparable and old is not None and name not in SHAPE and old > 0:
+                change = (value - old) / old
+                worse = -change if name in HIGHER_IS_BETTER else change
+                line += ' (baseline ' + str('{:.3f}'.format(old)) + ', ' + str('{:+.1f}'.format(change * 100)) + '%)'
+                if worse > tolerance:
+                    line += ' REGRESSION'
+                    regressions.append(section + '.' + name)
+
+            print(line)
+
+    return regressions
+
+def main():
+    """
+    Parse arguments, run the benchmarks, compare them against the baseline, and exit with status 1 on a regression or
+    when there is no baseline to compare against.
+
+    @param N/A
+    @return N/A
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-sizes', default=DEFAULT_SIZES)
+    parser.add_argument('-pages', type=int, default=500)
+    parser.add_argument('-depth', type=int, default=3)
+    parser.add_argument('-latency', type=float, default=0.005)
+    parser.add_argument('-queries', type=int, default=1000)
+    parser.add_argument('-duplicates', type=float, default=0.0)
+    parser.add_argument('-baseline', default=BASELINE)
+    parser.add_argument('-tolerance', type=float, default=0.25)
+    parser.add_argument('-save-baseline', action='store_true')
+    parser.add_argument('-skip-crawl', action='store_true')
+
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    elif not args.save_baseline:
+        # fail before spending minutes on benchmarks that cannot be compared against anything
+        print('FAIL: no baseline at ' + args.baseline + '; record one on this machine with -save-baseline')
+        exit(1)
+
+    results = {'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()}}
+
+    if not args.skip_crawl:
+        print('Crawling ' + str(args.pages) + ' fixture pages')
+        results['crawl'] = bench_crawl(args.pages, args.depth, args.latency)
+
+    for size in sizes:
+        print('Indexing ' + str(size) + ' documents')
+        results['index_' + str(size)] = run_index(size, args.queries, args.duplicates)
+
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+        print('Saved baseline to ' + args.baseline)
+        return
+
+    if regressions:
+        print('FAIL: ' + ', '.join(regressions) + ' regressed by more than ' + str(args.tolerance * 100) + '%')
+        exit(1)
+    else:
+        print('OK')
+
+if __name__ == '__main__':
+    main()
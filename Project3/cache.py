@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+
+class QueryCache:
+    """
+    Bounded least-recently-used cache of ranked search results.
+
+    Entries are only valid for the index version they were computed against. SearchEngine bumps its index
+    version whenever the index changes, and the first lookup with a new version empties the cache, so stale
+    results are never returned. Results computed against an older version than the cache's are never stored,
+    which matters when a query was still running while the index was replaced. All methods are thread safe.
+    """
+
+    def __init__(self, capacity):
+        """
+        Constructor that creates an empty cache.
+
+        @param capacity: maximum number of queries to keep.
+        @return N/A
+        """
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, version):
+        """
+        Look up the results cached for a normalized query.
+
+        @param key: normalized query string. version: current index version.
+        @return cached list of results, or None on a miss.
+        """
+        with self.lock:
+            if not self.check_version(version):
+                self.misses += 1
+                return None
+
+            results = self.entries.get(key)
+            if results is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return results
+
+    def put(self, key, version, results):
+        """
+        Cache the results of a normalized query, evicting the least recently used query if the cache is full.
+
+        @param key: normalized query string. version: index version the results were computed against. results: list of results.
+        @return N/A
+        """
+        with self.lock:
+            if not self.check_version(version):
+                return
+
+            self.entries[key] = results
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def check_version(self, version):
+        """
+        Empty the cache when a newer index version is seen. Caller holds the lock.
+
+        @param version: index version of the lookup or results.
+        @return False if version is older than the cached entries' version, True otherwise.
+        """
+        if self.version is not None and version < self.version:
+            return False
+
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+
+        return True
@@ -0,0 +1,71 @@
+"""
+Thin command line client for the query server started with 'python3 main.py -root <url> -mode S'.
+
+Imports nothing beyond the standard library and never loads the index itself, so a query costs one local HTTP
+request instead of starting the whole search engine. Results are printed in the same format as command mode.
+"""
+
+import sys
+import json
+import argparse
+import http.client
+from urllib.parse import quote
+
+# same default as DEFAULT_PORT in server.py, repeated so this client does not import the server
+DEFAULT_PORT = 8423
+
+def main():
+    """
+    Parse arguments, send the query or train request to the server, and print the response.
+
+    @param N/A
+    @return N/A
+    """
+    if '-query' not in sys.argv and '-train' not in sys.argv:
+        print('ERROR: Missing query argument')
+        exit()
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-query')
+    parser.add_argument('-port')
+    parser.add_argument('-train', action='store_true')
+
+    args = parser.parse_args()
+
+    if args.port != None and not args.port.isdigit():
+        print('ERROR: Invalid arguments provided')
+        exit()
+
+    port = DEFAULT_PORT if args.port == None else int(args.port)
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+
+    try:
+        if args.train:
+            conn.request('POST', '/admin/train')
+        else:
+            conn.request('GET', '/search?q=' + quote(args.query))
+        response = conn.getresponse()
+        body = json.loads(response.read())
+    except OSError:
+        print('ERROR: Could not connect to server on port ' + str(port))
+        exit()
+
+    if response.status != 200:
+        print('ERROR: ' + body['error'])
+        exit()
+
+    if args.train:
+        print('Trained: ' + str(body['documents']) + ' documents indexed')
+        return
+
+    printed = 0
+    for result in body['results']:
+        print('[' + str(printed + 1) + '] ' + result['url'] + ' (' + str('{:.2f}'.format(result['score'])) + ')')
+        printed += 1
+
+    if printed == 0:
+        print('Your search did not match any documents. Try again.')
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,92 @@
-import requests
-import re, string
-from bs4 import BeautifulSoup
-from urllib.request import Request, urlopen
-from urllib.error import HTTPError, URLError
+import os, time, string, threading, unicodedata
+import importlib.util
+from itertools import repeat
+from metrics import Metrics, timed_call
+from scheduler import CrawlScheduler
+
+# use the much faster lxml parser backend when it is installed
+PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+# content types downloaded; responses of any other type are closed before their body is read
+HTML_TYPES = ('text/html', 'application/xhtml+xml')
+
+# single translate pass: lowercase letters and turn punctuation into spaces
+CLEAN_TABLE = str.maketrans(string.ascii_uppercase + string.punctuation,
+                            string.ascii_lowercase + ' ' * len(string.punctuation))
+
+def make_soup(page):
+    """
+    Parse a webpage with BeautifulSoup.
+
+    bs4 is imported here rather than at module load, so query-only uses of this module never load it.
+
+    @param page: raw bytes or response object of a webpage.
+    @return BeautifulSoup object.
+    """
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(page, PARSER)
+
+def extract_text(html):
+    """
+    Extract the text of <td> elements in 'table_default' tables and <p> elements in 'entry-content' or 'person_content' divs.
+
+    Each text node is extracted exactly once, even when a <p> sits inside a table cell that was already extracted.
+    This is a module level function so it can run in a ProcessPoolExecutor worker.
+
+    @param html: raw bytes of a webpage.
+    @return string containing the extracted text.
+    """
+    soup = make_soup(html)
+
+    parts = []
+    seen = set()
+
+    # check all tables from current page
+    for i in soup.find_all('table', {'class':'table_default'}):
+        for j in i.find_all('td'):
+            if any(id(parent) in seen for parent in j.parents):
+                continue
+            seen.add(id(j))
+            parts.append(j.get_text(' '))
+
+    # check all divs of these class attributes from current page
+    for i in soup.find_all('div', {'class':['entry-content', 'person_content']}):
+        for j in i.find_all('p'):
+            if any(id(parent) in seen for parent in j.parents):
+                continue
+            seen.add(id(j))
+            parts.append(j.get_text(' '))
+
+    return ' '.join(parts)
+
+def process_pool(workers):
+    """
+    Create a process pool for extracting and cleaning pages while download threads, or the query server's threads, are running.
+
+    Workers are started from a separate server process where the platform supports it, because forking this process
+    while another thread holds a lock, such as the import lock, can leave a worker deadlocked on that lock forever.
+
+    @param workers: number of worker processes.
+    @return ProcessPoolExecutor.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('forkserver'))
+    return ProcessPoolExecutor(workers)
+
+def clean_text(d):
+    """
+    Clean a single document in one pass over a precompiled translate table.
+
+    Fold unicode to ascii (dropping accents rather than whole characters), convert to lowercase, turn all punctuation
+    into spaces, and collapse runs of whitespace. This is a module level function so it can run in a ProcessPoolExecutor worker.
+
+    @param d: string scraped by crawl().
+    @return cleaned string.
+    """
+    d_temp = unicodedata.normalize('NFKD', str(d)).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(d_temp.translate(CLEAN_TABLE).split())
 
 class WebCrawler:
     """
@@ -11,23 +95,42 @@ class WebCrawler:
     Getter and setter methods for getting and setting links and documents. Mostly unused and
     exist to meet project specification. collect() method for scraping links from webpages,
     crawl() method for scraping text from collected webpages, and clean() method for modifying
-    scraped text to be used in tfidf training, performed in engine.py.
+    scraped text to be used in tfidf training, performed in engine.py. crawl() downloads pages
+    in a thread pool and hands the CPU-bound parsing to a separate process pool, so parsing
+    scales with the number of cores independently of how many downloads are in flight. collect() takes links from a
+    CrawlScheduler best first, and stops early once an optional page, time, or byte budget runs out.
     """
 
-    def __init__(self, root, verbosity, depth):
+    def __init__(self, root, verbosity, depth, fetch_workers=16, parse_workers=None, metrics=None, domain='utk.edu',
+                 max_pages=None, max_seconds=None, max_bytes=None):
         """
-        Constructor that saves root url, verbosity, depth, and collected/crawled base values as member variables.
+        Constructor that saves root url, verbosity, depth, worker counts, metrics, domain, budgets, and collected/crawled base values as member variables.
 
         Called when instance is created in engine.py, SearchEngine's constructor.
 
         @param root: root url to begin web crawling. verbosity: determines debugging output T/F. depth: layer of links to explore.
+               fetch_workers: number of concurrent downloads. parse_workers: number of parsing/cleaning processes, defaults to one per core.
+               metrics: Metrics that download, parse, and clean timings are recorded in, a new one if None.
+               domain: only links containing this string are collected, such as the host of a local benchmark site.
+               max_pages: most links to collect. max_seconds: most seconds to spend collecting links. max_bytes: most bytes
+               to download before collecting stops. None means unlimited. The same budgets limit the links taken from a
+               saved links.pickle by iter_saved().
         @return N/A
         """
         self.root = root
         self.verbosity = verbosity
         self.depth = depth
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.metrics = metrics or Metrics()
+        self.domain = domain
+        self.max_pages = max_pages
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
         self.collected = 1
         self.crawled = 0
+        # guards crawled when pages are fetched from several threads
+        self.lock = threading.Lock()
     
     def get_documents(self):
         """
@@ -77,59 +180,75 @@ class WebCrawler:
         """
         Collect all links from root link s, as well as every link from those links up to depth d.
 
-        If d = 0, only collect links on the root s's page. Collect links from each link up to depth d.
+        If d = 0, only collect links on the root s's page. Collect links from each link up to depth d. Links are taken
+        from a CrawlScheduler, most promising first, until none are left or a budget runs out. Links to files that are
+        not HTML, judged by their extension, are never collected.
 
         @param s: root url to collect links from. d: depth to collect links from.
         @return N/A
         """
+        for link in self.iter_collect(s, d):
+            pass
+
+    def iter_collect(self, s, d):
+        """
+        Generator version of collect() that yields every link as soon as it is taken from the frontier.
+
+        Lets the streaming pipeline start crawling and indexing pages while links are still being collected, the most
+        promising pages first. When the generator is exhausted the flattened list of links has been saved with
+        set_links(), exactly as collect() does.
+
+        @param s: root url to collect links from. d: depth to collect links from.
+        @return generator of urls.
+        """
         if self.verbosity == 'T':
             print('collect(): [VERBOSE] 1. COLLECTING LINKS - STARTED')
 
-        hdr = {'User-Agent': 'Mozilla/5.0'}
+        scheduler = CrawlScheduler(self.max_pages, self.max_seconds, self.max_bytes)
+        scheduler.push(s, 0)
+        # bytes downloaded before this collection started do not count towards its budget
+        bytes_before = self.metrics.get('bytes_fetched')
 
-        self.link_level = [[s]]
-        
-        if self.verbosity == 'T':
-            print('collect(): [VERBOSE] COLLECTED: LINK (1)')
-
-        depth = 0
-
-        while depth <= d: 
-            self.link_level.append([])
-
-            for link in self.link_level[depth]:
-                req = Request(link, headers=hdr)
-                
-                try:
-                    page = urlopen(req)
-                except HTTPError as err:
-                    #print(err.code)
-                    #print('Error on link: ' + link)
-                    continue
-                except URLError as uerr:
-                    #print('Error on link: ' + link)
-                    continue
-
-                soup = BeautifulSoup(page, 'html.parser')
-
-                # find all links in HTML <a> fields
-                for i in soup.find_all('a'):
-                    # if a valid href field leading to http or https link in utk.edu domain, check if it has been collected yet
-                    if i.get('href') != None and i.get('href').startswith('http') and 'utk.edu' in i.get('href'):
-                        unique = True
-                        for level in self.link_level:   
-                            if i.get('href') in level or i.get('href')[:-1] in level:
-                                unique = False
-                                break
-                        
-                        # if it hasn't been collected, add it to the list of collected links
-                        if unique:
-                            self.collected += 1
-                            if self.verbosity == 'T':
-                                print('collect(): [VERBOSE] COLLECTED: LINK (' + str(self.collected) + ')')
-                            self.link_level[depth + 1].append(i.get('href'))
-
-            depth += 1
+        self.link_level = [[] for depth in range(d + 2)]
+        self.collected = 0
+
+        while True:
+            budget = scheduler.exhausted(self.metrics.get('bytes_fetched') - bytes_before)
+            if budget is not None:
+                self.metrics.count('crawl_budget_reached', labels={'budget': budget})
+                if self.verbosity == 'T':
+                    print('collect(): [VERBOSE] ' + budget.upper() + ' BUDGET REACHED, ' + str(len(scheduler)) + ' LINKS LEFT')
+                break
+
+            entry = scheduler.pop()
+            if entry is None:
+                break
+
+            link, depth = entry
+            self.collected += 1
+            self.link_level[depth].append(link)
+            if self.verbosity == 'T':
+                print('collect(): [VERBOSE] COLLECTED: LINK (' + str(self.collected) + ')')
+            yield link
+
+            # links on pages at depth d + 1 are not followed
+            if depth > d:
+                continue
+
+            page = self.fetch(link)
+            if page is None:
+                continue
+
+            has_content = scheduler.record(link, page)
+            soup = make_soup(page)
+
+            # find all links in HTML <a> fields
+            for i in soup.find_all('a'):
+                href = i.get('href')
+                # if a valid href field leading to http or https link in the domain, add it to the frontier
+                if href != None and href.startswith('http') and self.domain in href:
+                    if scheduler.push(href, depth + 1, i.get_text(' '), has_content) == 'skipped':
+                        self.metrics.count('links_skipped', labels={'reason': 'extension'})
 
         if self.verbosity == 'T':
             print('collect(): [VERBOSE] 1. COLLECTING LINKS - DONE')
@@ -142,13 +261,40 @@ class WebCrawler:
                 links.append(link)
 
         self.set_links(links)
-        
+
+    def iter_saved(self, links):
+        """
+        Generator that yields links loaded from links.pickle in their saved order until a budget runs out.
+
+        Saved links were collected without the budgets of this run, so the page, time, and byte budgets are applied to
+        them here instead, the same way iter_collect() applies them to the frontier. Bytes count the pages the crawl
+        pipeline downloads, so as in iter_collect() links already handed to the pipeline are still crawled.
+
+        @param links: list of urls, usually get_links().
+        @return generator of urls.
+        """
+        scheduler = CrawlScheduler(self.max_pages, self.max_seconds, self.max_bytes)
+        # bytes downloaded before this crawl started do not count towards its budget
+        bytes_before = self.metrics.get('bytes_fetched')
+
+        for n, link in enumerate(links):
+            budget = scheduler.exhausted(self.metrics.get('bytes_fetched') - bytes_before)
+            if budget is not None:
+                self.metrics.count('crawl_budget_reached', labels={'budget': budget})
+                if self.verbosity == 'T':
+                    print('crawl(): [VERBOSE] ' + budget.upper() + ' BUDGET REACHED, ' + str(len(links) - n) + ' SAVED LINKS LEFT')
+                break
+
+            scheduler.taken += 1
+            yield link
+
     def crawl(self):
         """
         Scrape all <p> elements inside <div> elements with class attributes 'entry-content' or 'person_content'.
 
         Collect all text from above listed elements and save them as 'documents' associated with a url. Also scrapes
-        from <table> elements that have 'table_default' as class attribute.
+        from <table> elements that have 'table_default' as class attribute. Pages are downloaded by fetch_workers threads
+        and each downloaded page is parsed by extract_text() in a pool of parse_workers processes as soon as it arrives.
 
         @param N/A
         @return N/A
@@ -156,54 +302,100 @@ class WebCrawler:
         if self.verbosity == 'T':
             print('crawl(): [VERBOSE] 2. CRAWLING LINKS - STARTED')
 
-        self.docs = []
+        from concurrent.futures import ThreadPoolExecutor, as_completed
 
-        hdr = {'User-Agent': 'Mozilla/5.0'}
+        # flattened in the same order as get_links() so indices of documents correspond to links
+        links = [link for level in self.link_level for link in level]
+        self.docs = [''] * len(links)
 
-        # scrape from all collected links
-        for level in self.link_level:
-            for link in level:
-                self.docs.append('')
+        with ThreadPoolExecutor(self.fetch_workers) as fetchers, process_pool(self.parse_workers) as parsers:
+            fetches = {fetchers.submit(self.fetch, link): i for i, link in enumerate(links)}
+            parses = {}
 
+            # scrape from all collected links
+            for future in as_completed(fetches):
                 self.crawled += 1
                 if self.verbosity == 'T':
                     print('crawl(): [VERBOSE] CRAWLING: LINK (' + str(self.crawled) + '/' + str(self.collected) + ')')
-        
-                req = Request(link, headers=hdr)
-                
-                try:
-                    page = urlopen(req)
-                except HTTPError as err:
-                    #print(err.code)
-                    #print('Error on link: ' + link)
-                    continue
-                except URLError as uerr:
-                    #print('Error on link: ' + link)
-                    continue
-
-                soup = BeautifulSoup(page, 'html.parser')
-
-                # append each scraped string to this link's associated document
-
-                # check all tables from current link
-                for i in soup.find_all('table', {'class':'table_default'}):
-                    for j in i.find_all('td'):
-                        self.docs[self.crawled - 1] += j.text + ' ' #str(j.renderContents()) + ' '
-
-                # check all divs of these class attributes from current link
-                for i in soup.find_all('div', {'class':['entry-content', 'person_content']}):
-                    for j in i.find_all('p'):
-                        self.docs[self.crawled - 1] += i.text + ' '
-        
+
+                html = future.result()
+                if html is not None:
+                    parses[parsers.submit(timed_call, extract_text, html)] = fetches[future]
+
+            for future in as_completed(parses):
+                self.docs[parses[future]], seconds = future.result()
+                self.metrics.observe('parse_seconds', seconds)
+
         if self.verbosity == 'T':
             print('crawl(): [VERBOSE] 2. CRAWLING LINKS - DONE')
 
+    def fetch(self, link):
+        """
+        Download a single webpage.
+
+        Records the download time, the pages and bytes downloaded, and failed downloads by HTTP status in metrics.
+        Failures without an HTTP status, such as a refused connection, are counted under the status 'unreachable', and
+        malformed urls and responses cut off or reset while reading under the status 'failed'.
+        Responses whose Content-Type is not HTML are closed without reading their body.
+
+        @param link: url of the page to download.
+        @return raw bytes of the page, or None if the page could not be downloaded or is not HTML.
+        """
+        from urllib.request import Request, urlopen
+        from urllib.error import HTTPError, URLError
+        from http.client import HTTPException
+
+        hdr = {'User-Agent': 'Mozilla/5.0'}
+        req = Request(link, headers=hdr)
+
+        start = time.perf_counter()
+        try:
+            response = urlopen(req)
+            content_type = response.headers.get('Content-Type')
+            if content_type is not None and content_type.split(';')[0].strip().lower() not in HTML_TYPES:
+                response.close()
+                self.metrics.count('links_skipped', labels={'reason': 'content_type'})
+                return None
+            html = response.read()
+        except HTTPError as err:
+            self.metrics.count('fetch_errors', labels={'status': err.code})
+            return None
+        except URLError as uerr:
+            self.metrics.count('fetch_errors', labels={'status': 'unreachable'})
+            return None
+        except (HTTPException, OSError, ValueError):
+            # such as http.client.InvalidURL for a non-numeric port, IncompleteRead, or a connection reset or timeout
+            self.metrics.count('fetch_errors', labels={'status': 'failed'})
+            return None
+        finally:
+            self.metrics.observe('fetch_seconds', time.perf_counter() - start)
+
+        self.metrics.count('pages_fetched')
+        self.metrics.count('bytes_fetched', len(html))
+        return html
+
+    def scrape(self, link):
+        """
+        Scrape the text of a single webpage the same way crawl() does for every collected link.
+
+        Used by SearchEngine's update() to re-crawl a handful of pages without crawling the whole domain.
+
+        @param link: url of the page to scrape.
+        @return string containing the scraped text, empty if the page could not be downloaded.
+        """
+        html = self.fetch(link)
+        if html is None:
+            return ''
+
+        with self.metrics.timer('parse_seconds'):
+            return extract_text(html)
+
     def clean(self):
         """
         Clean all text scraped with crawl() for use in tfidf training.
 
-        Remove all unicode characters, all punctuation, all Twitter handles, all instances
-        of double-spaces, and convert all character to lowercase.
+        Remove all unicode characters, all punctuation, and all instances of double-spaces, and convert all
+        characters to lowercase. Documents are cleaned by clean_text() in a pool of parse_workers processes.
 
         @param N/A
         @return N/A
@@ -211,21 +403,29 @@ class WebCrawler:
         if self.verbosity == 'T':
             print('clean(): [VERBOSE] 3. CLEANING TEXT - STARTED')
 
-        cleaned_docs = []
-
         # clean every document scraped in crawl()
-        for d in self.docs:
-            # remove unicode by encoding/decoding
-            d_temp = str(d).encode('ascii', 'ignore')
-            d_temp = d_temp.decode()
-            
-            d_temp = d_temp.lower()
-            d_temp = re.sub(r'[%s]' % re.escape(string.punctuation), ' ', d_temp)
-            d_temp = re.sub('@[\w]+', '', d_temp)                       
-            ' '.join(d_temp.split())
-            cleaned_docs.append(d_temp)
+        if self.parse_workers > 1 and len(self.docs) > 1:
+            with process_pool(self.parse_workers) as cleaners:
+                chunksize = max(1, len(self.docs) // (4 * self.parse_workers))
+                timed = list(cleaners.map(timed_call, repeat(clean_text), self.docs, chunksize=chunksize))
+        else:
+            timed = [timed_call(clean_text, d) for d in self.docs]
+
+        cleaned_docs = []
+        for d, seconds in timed:
+            self.metrics.observe('clean_seconds', seconds)
+            cleaned_docs.append(d)
 
         self.set_documents(cleaned_docs)
 
         if self.verbosity == 'T':
             print('clean(): [VERBOSE] 3. CLEANING TEXT - DONE')
+
+    def clean_document(self, d):
+        """
+        Clean a single scraped document. See clean().
+
+        @param d: string scraped by crawl() or scrape().
+        @return cleaned string.
+        """
+        return clean_text(d)
@@ -0,0 +1,133 @@
+import hashlib
+import numpy as np
+
+# bit positions of a 64-bit fingerprint
+SHIFTS = np.arange(64, dtype=np.uint64)
+
+def hamming(a, b):
+    """
+    Count the bits that differ between two fingerprints.
+
+    @param a: fingerprint. b: fingerprint.
+    @return number of differing bits.
+    """
+    return bin(a ^ b).count('1')
+
+class DuplicateDetector:
+    """
+    Finds near-duplicate documents by comparing 64-bit SimHash fingerprints of their terms.
+
+    A document's fingerprint sets each bit to the sign of the sum, over its terms, of +1 or -1 (that bit of the term's
+    hash) times the term's weight, so documents sharing most of their terms get fingerprints that differ in only a few
+    bits. Fingerprints are split into bands of equal width, and each band indexes a lookup table. Two fingerprints that
+    differ in at most max_distance bits, with max_distance below the number of bands, must agree exactly on at least
+    one band. A lookup therefore only compares against the documents sharing a band, instead of every document.
+    """
+
+    def __init__(self, bands=4, max_distance=3, min_terms=10):
+        """
+        Constructor that creates empty band tables.
+
+        @param bands: number of bands the 64 bits are split into, must divide 64 and be greater than max_distance.
+               max_distance: most bits two fingerprints may differ in to count as near-duplicates.
+               min_terms: documents with fewer distinct terms only match identical fingerprints, since a few words are
+               too little evidence that two short documents are copies.
+        @return N/A
+        """
+        self.bands = bands
+        self.width = 64 // bands
+        self.max_distance = max_distance
+        self.min_terms = min_terms
+
+        self.known = {}
+        self.tables = [{} for band in range(bands)]
+
+    def __len__(self):
+        return len(self.known)
+
+    def term_hash(self, term):
+        """
+        Hash a term to 64 bits, the same way in every process so fingerprints never depend on PYTHONHASHSEED.
+
+        @param term: vocabulary term.
+        @return unsigned 64-bit integer.
+        """
+        return int.from_bytes(hashlib.blake2b(term.encode(), digest_size=8).digest(), 'little')
+
+    def fingerprints(self, counts, hashes):
+        """
+        Compute the SimHash fingerprints of a batch of documents with one sparse matrix product.
+
+        @param counts: scipy csr matrix of term counts, one row per document. hashes: numpy uint64 array holding the
+               term_hash() of every term, indexed by column.
+        @return list of unsigned 64-bit integer fingerprints, one per row.
+        """
+        import scipy.sparse as sp
+
+        # only the columns that occur in the batch need their +1/-1 bit signs expanded
+        columns, positions = np.unique(counts.indices, return_inverse=True)
+        signs = ((hashes[columns, None] >> SHIFTS) & np.uint64(1)).astype(np.float64) * 2 - 1
+
+        # sublinear term frequency, so one repeated word cannot outvote the rest of the document
+        weights = sp.csr_matrix((1 + np.log(counts.data), positions, counts.indptr), shape=(counts.shape[0], len(columns)))
+
+        bits = np.packbits(weights @ signs > 0, axis=1, bitorder='little')
+        return [int(f) for f in bits.view('<u8').ravel()]
+
+    def find(self, fingerprint, n_terms):
+        """
+        Find the closest known document that is a near-duplicate of a fingerprint.
+
+        @param fingerprint: fingerprint to look up. n_terms: number of distinct terms of the document it belongs to.
+        @return key of the closest near-duplicate, or None if there is none.
+        """
+        limit = self.max_distance if n_terms >= self.min_terms else 0
+        best = None
+        best_distance = limit + 1
+
+        for band, table in enumerate(self.tables):
+            for key in table.get(self.band(fingerprint, band), ()):
+                distance = hamming(fingerprint, self.known[key])
+                if distance < best_distance:
+                    best = key
+                    best_distance = distance
+
+        return best
+
+    def add(self, key, fingerprint):
+        """
+        Remember a document's fingerprint so later near-duplicates of it are found.
+
+        @param key: document key, such as its url. fingerprint: its fingerprint.
+        @return N/A
+        """
+        self.known[key] = fingerprint
+        for band, table in enumerate(self.tables):
+            table.setdefault(self.band(fingerprint, band), []).append(key)
+
+    def remove(self, key):
+        """
+        Forget a document's fingerprint.
+
+        @param key: document key. Keys that were never added are ignored.
+        @return N/A
+        """
+        fingerprint = self.known.pop(key, None)
+        if fingerprint is None:
+            return
+
+        for band, table in enumerate(self.tables):
+            value = self.band(fingerprint, band)
+            bucket = table[value]
+            bucket.remove(key)
+            if not bucket:
+                del table[value]
+
+    def band(self, fingerprint, band):
+        """
+        Extract one band of a fingerprint.
+
+        @param fingerprint: fingerprint. band: band number.
+        @return integer value of the band's bits.
+        """
+        return (fingerprint >> (band * self.width)) & ((1 << self.width) - 1)
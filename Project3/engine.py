@@ -1,27 +1,60 @@
 from crawler import WebCrawler
 from interface import SearchInterface
-from sklearn.feature_extraction.text import TfidfVectorizer
+from index import IncrementalIndex, MappedIndex, ClosedIndexError, saved_meta, saved_format, readable
+from cache import QueryCache
+from metrics import Metrics
 import os
-import pandas as pd
-import numpy as np
+import sys
+import time
+import json
+import shutil
 import pickle
+import threading
+
+# directory holding the saved index read by MappedIndex
+INDEX_DIR = 'index'
+# docs.pickle is written here while crawling and only renamed to docs.pickle once the crawl finished
+DOCS_TMP = 'docs.pickle.tmp'
+# number of distinct queries kept by the result cache
+CACHE_SIZE = 256
+# number of documents added to the index at a time
+BATCH_SIZE = 256
 
 class SearchEngine:
     """
     Manages a terminal search engine that conducts tfidf training on text scraped from wepages in the utk.edu domain.
 
     Constructor instantiates and uses WebCrawler and SearchInterface objects to collect data and accept queries from user.
-    Contains a number of methods to conduct tfidf training and access/store/delete the results.
+    Contains a number of methods to conduct tfidf training and access/store/delete the results. The tfidf index is an
+    IncrementalIndex, so update() can re-crawl a few pages without refitting the whole corpus. train() also saves the
+    index to disk, and command mode opens that saved index as a MappedIndex instead of training again. Ranked results are
+    kept in a QueryCache that is invalidated by bumping index_version whenever the index changes. With more than one
+    shard, queries are answered by a ShardedIndex that scores every shard of the saved index in its own process.
+    Near-duplicate pages are folded into one document by the index, so they never crowd each other out of the top five.
+    Timings and sizes of crawling, indexing, and queries are recorded in a Metrics shared with the WebCrawler.
+
+    Modules only needed to crawl, train, shard, or serve are imported by the methods that use them, so answering a single
+    query from a saved index in command mode only loads numpy and the standard library.
     """
     
-    def __init__(self, mode, verbosity, query, root, depth):
+    def __init__(self, mode, verbosity, query, root, depth, shards=None, queries=None, output=None, port=None, metrics=None,
+                 max_pages=None, max_seconds=None, max_bytes=None):
         """
         Constructor that saves parameters as member variables, instantiates crawler and interface objects, then begins tfidf training.
 
-        Called when instance is created in main.py.
+        Called when instance is created in main.py. In command, batch, and server mode training is skipped if a saved index exists
+        in a format MappedIndex reads; it is opened by search() or handle_batch() instead. An index saved in an older format is
+        replaced by training a new one, and so is one saved with a different number of shards than shards asks for.
+        If shards is None, a saved index is searched with the number of shards it was saved with.
 
         @param root: mode: take query from command line or from interactive terminal. verbosity: determines debugging output T/F.
                query: search term from command line. root: root url to begin web crawling. depth: layer of links to explore.
+               shards: number of shards to split the saved index into and search in parallel, None to keep the saved index's
+               number, or 1 if there is none. queries: file of queries for
+               batch mode, one per line. output: file batch mode writes results to, standard output if not given.
+               port: localhost port the query server listens on in server mode. metrics: file the metrics are written to
+               after training, updating, and answering queries, as Prometheus text if it ends in '.prom' and JSON otherwise.
+               max_pages, max_seconds, max_bytes: budgets of a crawl, see WebCrawler.
         @return N/A
         """
         self.mode = mode
@@ -29,45 +62,215 @@ class SearchEngine:
         self.query = query
         self.root = root
         self.depth = depth
+        self.shards = shards
+        self.queries = queries
+        self.output = output
+        self.port = port
+        self.metrics_path = metrics
+
+        self.metrics = Metrics()
+        self.index = None
+        self.searcher = None
+        # held while the searcher is opened lazily, so concurrent first queries open only one
+        self.searcher_lock = threading.Lock()
+        self.index_version = 0
+        self.cache = QueryCache(CACHE_SIZE)
 
-        self.crawler = WebCrawler(root, verbosity, depth)
+        self.crawler = WebCrawler(root, verbosity, depth, metrics=self.metrics, max_pages=max_pages, max_seconds=max_seconds, max_bytes=max_bytes)
         self.interface = SearchInterface(mode, self, query)
 
-        self.train()
+        meta = saved_meta(INDEX_DIR) if readable(INDEX_DIR) else None
+        if self.shards is None:
+            self.shards = meta['shards'] if meta is not None else 1
+
+        if saved_format(INDEX_DIR) is not None and meta is None:
+            print('The saved index is in format ' + str(saved_format(INDEX_DIR)) + ', which is no longer read; training a new one')
+        elif meta is not None and meta['shards'] != self.shards and mode != 'I':
+            print('The saved index has ' + str(meta['shards']) + ' shard(s) but -shards ' + str(self.shards) + ' was given; training it again to split it that way')
+
+        if mode == 'I' or meta is None or meta['shards'] != self.shards:
+            self.train()
         self.listen()
 
     def train(self):
         """
-        Method that runs collect(), crawl(), and clean() if needed, otherwise loads data from pickle files then computes tfidf.
+        Method that crawls and cleans pages if needed, otherwise loads data from pickle files then computes tfidf.
 
-        If links.pickle and docs.pickle already exist, this method simply loads the data then computes tfidf. If those files do
-        not exist, then they are created after collect(), crawl(), and clean run.
+        If links.pickle and docs.pickle already exist, this method simply streams the data into compute_tf_idf(). If docs.pickle
+        does not exist, pages flow through a CrawlPipeline straight into the index and into docs.pickle one document at a time,
+        so indexing starts before crawling finishes and the corpus is never held in memory at once. If links.pickle does not
+        exist either, links are fed to the pipeline by iter_collect() as they are collected, and otherwise the saved links are
+        fed by iter_saved(), so the crawl's page, time, and byte budgets apply either way. The resulting index is saved to INDEX_DIR.
+        The crawl's pages per second and the size of the saved index are recorded in metrics.
+
+        Crawled documents are written to DOCS_TMP, which replaces docs.pickle only after the crawl finished and links.pickle
+        was written, so an interrupted crawl never leaves a partial docs.pickle behind. If docs.pickle exists without
+        links.pickle, the links are recovered from the urls of its records.
 
         @param N/A
         @return N/A
         """
-        try:
-            with open('links.pickle', 'xb') as f:
-                self.crawler.collect(self.root, self.depth)
-                pickle.dump(self.crawler.get_links(), f)
-        except FileExistsError:
+        from pipeline import CrawlPipeline, read_documents
+
+        if os.path.exists('links.pickle'):
             with open('links.pickle', 'rb') as f:
                 self.crawler.set_links(pickle.load(f))
-        
-        try:
-            with open('docs.pickle', 'xb') as f:
-                self.crawler.crawl()
-                self.crawler.clean()
-                pickle.dump(self.crawler.get_documents(), f)
-        except FileExistsError:
-            with open('docs.pickle', 'rb') as f:
-                self.crawler.set_documents(pickle.load(f))
+            self.crawler.collected = len(self.crawler.get_links())
+            # budgets were not applied when the saved links were collected, so apply them to the links that are crawled
+            links = self.crawler.iter_saved(self.crawler.get_links())
+        else:
+            links = self.crawler.iter_collect(self.root, self.depth)
+
+        stored = os.path.exists('docs.pickle')
+        if stored:
+            loaded = os.path.exists('links.pickle')
+            recovered = {}
+            documents = read_documents('docs.pickle', self.crawler.get_links() if loaded else None)
+            self.compute_tf_idf(documents if loaded else self.remember(documents, recovered))
+            if not loaded:
+                self.crawler.set_links(list(recovered))
+                self.crawler.collected = len(recovered)
+        else:
+            if self.verbosity == 'T':
+                print('crawl(): [VERBOSE] 2. CRAWLING LINKS - STARTED')
+
+            start = time.perf_counter()
+            pages = self.crawler.crawled
+
+            with open(DOCS_TMP, 'wb') as f:
+                self.compute_tf_idf(self.store(CrawlPipeline(self.crawler).run(links), f))
+
+            elapsed = time.perf_counter() - start
+            self.metrics.set('crawl_seconds', elapsed)
+            # pages_fetched also counts the downloads iter_collect() makes to find links, so count the pipeline's pages instead
+            self.metrics.set('crawl_pages_per_second', (self.crawler.crawled - pages) / elapsed if elapsed > 0 else 0.0)
+
+            if self.verbosity == 'T':
+                print('crawl(): [VERBOSE] 2. CRAWLING LINKS - DONE')
+
+        if not os.path.exists('links.pickle'):
+            with open('links.pickle', 'wb') as f:
+                pickle.dump(self.crawler.get_links(), f)
+
+        # a DOCS_TMP this call did not write is left over from an interrupted crawl
+        if not stored:
+            os.replace(DOCS_TMP, 'docs.pickle')
+
+        self.restore_orphans()
+        self.save_index()
+        # swap the searcher before bumping the version, so results cached under the new version come from the new index
+        self.load_searcher()
+        self.index_version += 1
+
+        if self.verbosity == 'T':
+            print('train(): [VERBOSE] INDEXED: ' + str(len(self.index)) + ' DOCUMENTS, ' + str(len(self.index.canonical)) + ' NEAR-DUPLICATES FOLDED, '
+                  + str(len(self.index.vocabulary)) + ' TERMS IN ' + str('{:.2f}'.format(self.metrics.get('index_build_seconds'))) + 's')
+        self.save_metrics()
+
+    def save_index(self):
+        """
+        Save the in-memory index to INDEX_DIR and record its size in metrics.
+
+        @param N/A
+        @return N/A
+        """
+        with self.metrics.timer('index_save_seconds'):
+            self.index.save(INDEX_DIR, self.shards)
+
+        size = 0
+        for directory, subdirs, files in os.walk(INDEX_DIR):
+            size += sum(os.path.getsize(os.path.join(directory, name)) for name in files)
+
+        self.metrics.set('index_documents', len(self.index))
+        self.metrics.set('index_aliases', len(self.index.canonical))
+        self.metrics.set('index_terms', len(self.index.vocabulary))
+        self.metrics.set('index_bytes', size)
+
+    def restore_orphans(self):
+        """
+        Add the documents of aliases whose document was replaced or removed back to the index, reading them from docs.pickle.
+
+        Each one is either indexed on its own or folded into whichever document it is now a near-duplicate of.
 
-        self.compute_tf_idf()
+        @param N/A
+        @return N/A
+        """
+        from pipeline import read_documents
+
+        orphans = set(self.index.take_orphans())
+        if not orphans or not os.path.exists('docs.pickle'):
+            return
+
+        # later records of a url replace earlier ones
+        docs = {}
+        for link, doc in read_documents('docs.pickle', self.crawler.get_links()):
+            if link in orphans:
+                docs[link] = doc
+
+        self.index.add_documents(list(docs.keys()), list(docs.values()))
+
+    def aliases_of(self, url):
+        """
+        Return the urls of the near-duplicate pages folded into a search result.
+
+        @param url: url of a search result.
+        @return list of alias urls.
+        """
+        return self.searcher.aliases_of(url)
+
+    def load_searcher(self):
+        """
+        Choose the index handle_query() searches.
+
+        With more than one shard this starts a ShardedIndex over the saved index, stopping the workers of the previous one.
+        Otherwise the in-memory index is searched directly, or in command mode the saved index is opened as a MappedIndex.
+        In server mode the saved index is opened as a MappedIndex even after training, because it is searched without
+        the in-memory index's lock and so answers queries from all of the server's threads at once.
+        The new searcher is swapped in with a single assignment, so queries running in other threads finish on the old one.
+
+        @param N/A
+        @return N/A
+        """
+        old = self.searcher
+
+        if self.shards > 1:
+            from shards import ShardedIndex
+            self.searcher = ShardedIndex(INDEX_DIR)
+        elif self.index is not None and self.mode != 'S':
+            self.searcher = self.index
+        else:
+            self.searcher = MappedIndex(INDEX_DIR)
+
+        if self.shards > 1 and old is not None and old is not self.searcher:
+            old.close()
+
+    def store(self, documents, f):
+        """
+        Pass (url, cleaned document) pairs through unchanged while appending each one to docs.pickle.
+
+        @param documents: iterable of (url, cleaned document) tuples. f: docs.pickle opened for binary writing.
+        @return generator of the same tuples.
+        """
+        from pipeline import write_document
+
+        for link, doc in documents:
+            write_document(f, link, doc)
+            yield link, doc
+
+    def remember(self, documents, links):
+        """
+        Pass (url, cleaned document) pairs through unchanged while remembering each url once, in order.
+
+        @param documents: iterable of (url, cleaned document) tuples. links: dictionary the urls are added to as keys.
+        @return generator of the same tuples.
+        """
+        for link, doc in documents:
+            links[link] = None
+            yield link, doc
 
     def delete(self):
         """
-        Method that deletes data files links.pickle and docs.pickle.
+        Method that deletes data files links.pickle and docs.pickle, a partial docs.pickle left by an interrupted crawl, and the saved index.
 
         This is called when user inputs ':delete' in interactive mode.
 
@@ -78,63 +281,245 @@ class SearchEngine:
             os.remove('links.pickle')
         
         if os.path.exists('docs.pickle'):
-            os.remove('docs.pickle')                                                            
+            os.remove('docs.pickle')
+
+        if os.path.exists(DOCS_TMP):
+            os.remove(DOCS_TMP)
+
+        if os.path.exists(INDEX_DIR):
+            shutil.rmtree(INDEX_DIR)
+
+        self.index_version += 1
     
-    def compute_tf_idf(self):
+    def update(self, links):
         """
-        Read the cleaned documents and vectorizes the documents using Scikit-Learn's TfidfVectorizer.
+        Re-crawl a few links and update the index in place instead of retraining on the whole corpus.
 
-        Resulting dataframe has the TFIDF vocabulary as the index.
+        Links that are already indexed are replaced, new links are added, and links that no longer return any text
+        are removed from the index. Near-duplicates that were folded into a replaced link are indexed again. The new documents are appended to docs.pickle, where they replace the older copies
+        the next time it is loaded, and links.pickle and the saved index are rewritten so they match.
+        This is called when user inputs ':update <url> ...' in interactive mode.
 
-        @param N/A
+        @param links: list of urls to re-crawl.
         @return N/A
         """
-        self.tfidf_vectorizer = TfidfVectorizer() 
-        # Send our docs into the Vectorizer
-        tfidf_vectorizer_vectors = self.tfidf_vectorizer.fit_transform(self.crawler.cleaned_docs)
-        # Transpose the result into a more traditional TF-IDF matrix, and convert it to an array.
-        X = tfidf_vectorizer_vectors.T.toarray()
-        # Convert the matrix into a dataframe using feature names as the dataframe index.
-        self.df = pd.DataFrame(X, index=self.tfidf_vectorizer.get_feature_names())
+        from pipeline import write_document
+
+        docs = []
+        for link in links:
+            text = self.crawler.scrape(link)
+            with self.metrics.timer('clean_seconds'):
+                docs.append(self.crawler.clean_document(text))
+        self.index.add_documents(links, docs)
+
+        with open('docs.pickle', 'ab') as f:
+            for link, doc in zip(links, docs):
+                write_document(f, link, doc)
+
+        all_links = self.crawler.get_links()
+        known = set(all_links)
+        for link in links:
+            if link not in known:
+                known.add(link)
+                all_links.append(link)
+
+        with open('links.pickle', 'wb') as f:
+            pickle.dump(all_links, f)
+
+        self.restore_orphans()
+        self.save_index()
+        # swap the searcher before bumping the version, so results cached under the new version come from the new index
+        self.load_searcher()
+        self.index_version += 1
+
+        if self.verbosity == 'T':
+            print('update(): [VERBOSE] UPDATED: ' + str(len(links)) + ' LINK(S), ' + str(len(self.index)) + ' DOCUMENTS INDEXED')
+        self.save_metrics()
+
+    def compute_tf_idf(self, documents):
+        """
+        Read (url, cleaned document) pairs as they arrive and index them in an IncrementalIndex, BATCH_SIZE documents at a time.
+
+        Documents are tokenized the same way as Scikit-Learn's TfidfVectorizer and scored with the same smoothed idf
+        and l2 normalization, so results match a full TfidfVectorizer fit. Each batch becomes a small segment of the
+        index, and segments are merged in the background while later batches are still being crawled. Only the time spent
+        indexing is recorded as index_build_seconds in metrics, not the time spent waiting for documents to arrive.
+
+        @param documents: iterable of (url, cleaned document) tuples, such as a CrawlPipeline or read_documents().
+        @return N/A
+        """
+        self.index = IncrementalIndex()
+        build = 0.0
+
+        urls = []
+        docs = []
+        for link, doc in documents:
+            urls.append(link)
+            docs.append(doc)
+            if len(urls) == BATCH_SIZE:
+                start = time.perf_counter()
+                self.index.add_documents(urls, docs)
+                build += time.perf_counter() - start
+                urls = []
+                docs = []
+
+        start = time.perf_counter()
+        self.index.add_documents(urls, docs)
+        self.index.wait()
+        build += time.perf_counter() - start
+
+        self.metrics.set('index_build_seconds', build)
+
+    def search(self, query):
+        """
+        Clean a query the same way as the documents and return its five most similar documents, using the cache when possible.
+
+        Safe to call from several threads at once, which the query server does. The latency of every query, cached or not,
+        is recorded in metrics.
+
+        @param query: query string as typed by the user.
+        @return list of (url, score) tuples, most similar first.
+        """
+        start = time.perf_counter()
+
+        # command mode with a saved index opens it on the first query instead of training
+        if self.searcher is None:
+            with self.searcher_lock:
+                if self.searcher is None:
+                    self.load_searcher()
+
+        key = ' '.join(self.crawler.clean_document(query).split())
+        version = self.index_version
+        results = self.cache.get(key, version)
+
+        if results is not None:
+            self.metrics.count('queries', labels={'cache': 'hit'})
+            self.metrics.observe('query_seconds', time.perf_counter() - start)
+            if self.verbosity == 'T':
+                print('handle_query(): [VERBOSE] CACHE HIT (' + str(self.cache.hits) + ' HITS, ' + str(self.cache.misses) + ' MISSES)')
+            return results
+
+        while True:
+            searcher = self.searcher
+            try:
+                results = searcher.search(key, 5)
+                break
+            except ClosedIndexError:
+                # the index was swapped out while this query was running; retry on the new one
+                if searcher is self.searcher:
+                    raise
+
+        self.cache.put(key, version, results)
+        self.metrics.count('queries', labels={'cache': 'miss'})
+        self.metrics.observe('query_seconds', time.perf_counter() - start)
+        if self.verbosity == 'T':
+            print('handle_query(): [VERBOSE] CACHE MISS (' + str(self.cache.hits) + ' HITS, ' + str(self.cache.misses) + ' MISSES)')
+
+        return results
 
     def handle_query(self):
         """
         Vectorize the query, calculates the cosine similarity to extraced web documents, and prints up to five most related docs.
 
         Called by SearchInterface when it receives a query from the user in interactive mode, or once with the query provided in command mode.
+        The query is cleaned the same way as the documents, and the cleaned query is used to look up cached results before scoring.
 
         @param N/A
         @return N/A
         """
-        # Vectorize the query.
-        q = [self.query]
-        q_vec = self.tfidf_vectorizer.transform(q).toarray().reshape(self.df.shape[0],)
-    
-        # Calculate cosine similarity.
-        sim = {}
-        for i in range(len(self.df.columns)):
-            denom = np.linalg.norm(self.df.loc[:, i]) * np.linalg.norm(q_vec)
-            if denom == 0:
-                sim[i] = 0
-            else:
-                sim[i] = np.dot(self.df.loc[:, i].values, q_vec) / denom
-    
-        # Sort the values 
-        sim_sorted = sorted(sim.items(), key=lambda x: x[1], reverse=True)
-    
+        results = self.search(self.query)
+
         # Print the document number, associated url, and their similarity values
         # 'Document number' wasn't really clear, so I just printed the number in order of most similar (most similar 1, least similar 5)
         printed = 0
-        for k, v in sim_sorted:
-            if v != 0.0 and not pd.isna(v):
-                print('[' + str(printed + 1) + '] ' + self.crawler.links[k] + ' (' + str('{:.2f}'.format(v)) + ')')
-                printed += 1
-                if(printed == 5):
-                    break
-        
+        for link, v in results:
+            print('[' + str(printed + 1) + '] ' + link + ' (' + str('{:.2f}'.format(v)) + ')')
+            printed += 1
+
         if printed == 0:
             print('Your search did not match any documents. Try again.')
 
+    def serve(self):
+        """
+        Run the query server until it is interrupted.
+
+        Called by SearchInterface in server mode. A saved index that was not trained in this run is opened before the
+        server starts, so the first queries do not race to open it.
+
+        @param N/A
+        @return N/A
+        """
+        from server import SearchServer
+        if self.searcher is None:
+            self.load_searcher()
+        SearchServer(self, self.port).run()
+
+    def handle_batch(self):
+        """
+        Answer every query in the queries file and write the top five results of each query as one JSON line.
+
+        Queries are cleaned like in handle_query(), then scored against the saved index together by MappedIndex's search_batch(),
+        which uses one sparse matrix-matrix product per chunk of queries instead of scoring queries one at a time.
+
+        @param N/A
+        @return N/A
+        """
+        start = time.perf_counter()
+
+        with open(self.queries) as f:
+            queries = [line.rstrip('\n') for line in f if line.strip()]
+
+        cleaned = [' '.join(self.crawler.clean_document(q).split()) for q in queries]
+        index = MappedIndex(INDEX_DIR)
+
+        out = open(self.output, 'w') if self.output != None else sys.stdout
+        try:
+            for query, results in zip(queries, index.search_batch(cleaned, 5)):
+                line = {'query': query, 'results': [{'url': link, 'score': round(v, 6), 'aliases': index.aliases_of(link)} for link, v in results]}
+                out.write(json.dumps(line) + '\n')
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+        elapsed = time.perf_counter() - start
+        self.metrics.count('batch_queries', len(queries))
+        self.metrics.set('batch_seconds', elapsed)
+        self.metrics.set('batch_queries_per_second', len(queries) / elapsed if elapsed > 0 else 0.0)
+
+        if self.verbosity == 'T':
+            print('handle_batch(): [VERBOSE] ANSWERED: ' + str(len(queries)) + ' QUERIES')
+        self.save_metrics()
+
+    def stats(self, path=None):
+        """
+        Print every metric recorded so far, or write them to a file.
+
+        Called when user inputs ':stats' or ':stats <file>' in interactive mode.
+
+        @param path: file to write the metrics to, as Prometheus text if it ends in '.prom' and JSON otherwise. None prints them.
+        @return N/A
+        """
+        if path != None:
+            self.metrics.dump(path)
+            return
+
+        lines = self.metrics.report()
+        for line in lines:
+            print(line)
+
+        if len(lines) == 0:
+            print('No metrics recorded yet.')
+
+    def save_metrics(self):
+        """
+        Write every metric recorded so far to the -metrics file, if one was given.
+
+        @param N/A
+        @return N/A
+        """
+        if self.metrics_path != None:
+            self.metrics.dump(self.metrics_path)
+
     def listen(self):
         """
         Method simply calls the SearchInterface's listen method for receiving user input.
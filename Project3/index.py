@@ -0,0 +1,1042 @@
+import re
+import os
+import json
+import mmap
+import shutil
+import zlib
+import bisect
+import heapq
+import threading
+from collections import Counter
+import numpy as np
+
+# scipy.sparse is imported by the methods that build matrices rather than here, so opening a saved index to answer
+# queries only needs numpy
+
+# same token pattern TfidfVectorizer uses by default, so scores match a full refit
+TOKEN_PATTERN = re.compile(r'(?u)\b\w\w+\b')
+# version of the flat file format written by save(); MappedIndex also reads format 2, which stored float64 weights
+# and raw int32 document ids
+FORMAT = 3
+# oldest format MappedIndex reads; format 1 had no shards
+OLDEST_FORMAT = 2
+
+class ClosedIndexError(Exception):
+    """
+    Raised when searching an index that has already been closed, such as a ShardedIndex whose workers were stopped.
+    """
+
+class IndexFormatError(Exception):
+    """
+    Raised when opening a saved index in a format MappedIndex cannot read, such as one saved by an older version.
+    """
+
+def saved_meta(path):
+    """
+    Read the meta.json of the index saved in a directory without opening it.
+
+    @param path: directory written by IncrementalIndex's save().
+    @return dictionary of the saved index's format, sizes, and number of shards, or None if there is no saved index in path.
+    """
+    meta = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta):
+        return None
+    with open(meta) as f:
+        return json.load(f)
+
+def saved_format(path):
+    """
+    Read the format of the index saved in a directory without opening it.
+
+    @param path: directory written by IncrementalIndex's save().
+    @return format number, 0 if meta.json does not record one, or None if there is no saved index in path.
+    """
+    meta = saved_meta(path)
+    if meta is None:
+        return None
+    return meta.get('format', 0)
+
+def readable(path):
+    """
+    Check whether a directory holds a saved index that MappedIndex can open.
+
+    @param path: directory written by IncrementalIndex's save().
+    @return True if there is a saved index in a format MappedIndex reads.
+    """
+    saved = saved_format(path)
+    return saved is not None and OLDEST_FORMAT <= saved <= FORMAT
+
+def tokenize(text):
+    """
+    Split a cleaned document or query into terms the same way TfidfVectorizer's default analyzer does.
+
+    @param text: string to split into terms.
+    @return list of lowercase terms.
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+def top_k(scores, k):
+    """
+    Return the positions of the k highest positive scores without sorting the whole array.
+
+    @param scores: numpy array of scores. k: maximum number of positions to return.
+    @return numpy array of positions, highest score first.
+    """
+    hits = np.flatnonzero(scores > 0)
+    if len(hits) > k:
+        hits = hits[np.argpartition(-scores[hits], k)[:k]]
+    return hits[np.argsort(-scores[hits], kind='stable')]
+
+def shard_of(url, shards):
+    """
+    Assign a url to a shard by a stable hash, so the same url always lands in the same shard.
+
+    @param url: document url. shards: number of shards.
+    @return shard number from 0 to shards - 1.
+    """
+    return zlib.crc32(url.encode()) % shards
+
+def shard_dir(path, shard):
+    """
+    Return the directory holding one shard's postings and url table inside a saved index.
+
+    @param path: directory of the saved index. shard: shard number.
+    @return path of the shard directory.
+    """
+    return os.path.join(path, 'shard-%03d' % shard)
+
+def merge_results(results, k):
+    """
+    Merge (url, score) results from several shards into the global top k.
+
+    @param results: list of (url, score) tuples. k: maximum number of results.
+    @return list of (url, score) tuples, most similar first.
+    """
+    return heapq.nlargest(k, results, key=lambda r: r[1])
+
+class Segment:
+    """
+    Immutable batch of documents stored as a sparse matrix of raw term counts, one row per document.
+
+    Rows are never removed from a segment; deleted or replaced documents are tombstoned by clearing
+    their entry in the alive mask, and are dropped for good when the segment is merged.
+    """
+
+    def __init__(self, urls, counts, level):
+        """
+        Constructor that saves urls and term counts and caches the squared counts used for document norms.
+
+        @param urls: list of urls, one per row. counts: scipy csr matrix of term counts (documents x terms).
+               level: LSM level of this segment, higher levels hold more documents.
+        @return N/A
+        """
+        self.urls = urls
+        self.counts = counts
+        self.squared = counts.multiply(counts).tocsr()
+        self.alive = np.ones(len(urls), dtype=bool)
+        self.level = level
+        self.norms = None
+        self.norms_version = -1
+
+    def doc_norms(self, idf, idf_version):
+        """
+        Return the l2 norm of every tfidf row, recomputing it only when the idf weights have changed since the last call.
+
+        @param idf: current idf vector. idf_version: counter bumped every time idf changes.
+        @return numpy array of row norms.
+        """
+        if self.norms_version != idf_version:
+            w = idf[:self.counts.shape[1]]
+            self.norms = np.sqrt(self.squared @ (w * w))
+            self.norms_version = idf_version
+        return self.norms
+
+class IncrementalIndex:
+    """
+    TFIDF index that can be updated a few documents at a time instead of being refit on the whole corpus.
+
+    New documents are appended as small segments and deleted or changed documents are tombstoned, while
+    document frequencies are kept up to date so idf weights can be recomputed in O(vocabulary) time.
+    Segments are merged LSM-style in a background thread once a level fills up, and a full compaction
+    into one segment only happens when too many tombstoned rows have piled up.
+
+    Near-duplicate documents, such as print views or paginated copies of the same page, are detected at ingest by a
+    DuplicateDetector and folded into the first copy indexed, which keeps the other urls as aliases instead of adding
+    rows of its own. When a document with aliases is replaced or removed, its aliases are set aside as orphans, and
+    take_orphans() returns them so the caller can add their documents again.
+    """
+
+    def __init__(self, fan_in=4, base_size=64, max_dead_ratio=0.3, background=True, dedup=True):
+        """
+        Constructor that sets up an empty vocabulary, document frequencies, and segment list.
+
+        @param fan_in: number of segments of one level merged into the next level. base_size: documents held by a level 0 segment.
+               max_dead_ratio: fraction of tombstoned rows that triggers a full compaction. background: merge in a separate thread.
+               dedup: fold near-duplicate documents into one document with aliases.
+        @return N/A
+        """
+        self.fan_in = fan_in
+        self.base_size = base_size
+        self.max_dead_ratio = max_dead_ratio
+        self.background = background
+
+        self.vocabulary = {}
+        self.df = np.zeros(0, dtype=np.int64)
+        self.n_docs = 0
+        self.n_dead = 0
+        self.segments = []
+        self.locations = {}
+
+        self.duplicates = None
+        if dedup:
+            from dedup import DuplicateDetector
+            self.duplicates = DuplicateDetector()
+        self.term_hashes = np.zeros(0, dtype=np.uint64)
+        self.aliases = {}
+        self.canonical = {}
+        self.orphans = []
+
+        self.idf = np.zeros(0)
+        self.idf_version = 0
+        self.idf_stale = True
+
+        self.lock = threading.RLock()
+        self.merging = set()
+        self.merge_threads = []
+
+    def __len__(self):
+        return self.n_docs
+
+    def add_documents(self, urls, docs):
+        """
+        Add or replace documents in the index as a new segment.
+
+        A url that is already indexed has its old row tombstoned first. Documents without any terms
+        (such as pages that failed to download) are only removed, never indexed. A document that is a
+        near-duplicate of an indexed one becomes an alias of it instead of getting a row.
+
+        @param urls: list of urls. docs: list of cleaned documents, same length as urls.
+        @return N/A
+        """
+        import scipy.sparse as sp
+
+        # last occurrence of a url in the batch wins
+        latest = {}
+        for url, doc in zip(urls, docs):
+            latest[url] = doc
+
+        with self.lock:
+            new_urls = []
+            indices = []
+            data = []
+            indptr = [0]
+
+            for url, doc in latest.items():
+                self._remove(url)
+
+                counts = Counter(self._term_id(t) for t in tokenize(doc))
+                if not counts:
+                    continue
+
+                new_urls.append(url)
+                indices.extend(counts.keys())
+                data.extend(counts.values())
+                indptr.append(len(indices))
+
+            # counts are small integers, exact in float32 at half the memory of float64
+            counts = sp.csr_matrix((np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr)),
+                                   shape=(len(new_urls), len(self.vocabulary)))
+
+            if self.duplicates is not None and new_urls:
+                # fingerprint the whole batch at once, then look documents up one at a time so copies within the batch are found too
+                keep = []
+                for row, fingerprint in enumerate(self.duplicates.fingerprints(counts, self.term_hashes)):
+                    url = new_urls[row]
+                    original = self.duplicates.find(fingerprint, counts.indptr[row + 1] - counts.indptr[row])
+                    if original is None:
+                        self.duplicates.add(url, fingerprint)
+                        keep.append(row)
+                    else:
+                        self.aliases.setdefault(original, []).append(url)
+                        self.canonical[url] = original
+
+                if len(keep) < len(new_urls):
+                    new_urls = [new_urls[row] for row in keep]
+                    counts = counts[keep]
+
+            if not new_urls:
+                self._maybe_merge()
+                return
+
+            segment = Segment(new_urls, counts, self._level(len(new_urls)))
+
+            self.df[:counts.shape[1]] += np.bincount(counts.indices, minlength=counts.shape[1])
+            self.n_docs += len(new_urls)
+            self.segments.append(segment)
+            for row, url in enumerate(new_urls):
+                self.locations[url] = (segment, row)
+            self.idf_stale = True
+
+            self._maybe_merge()
+
+    def aliases_of(self, url):
+        """
+        Return the urls of the near-duplicates folded into a document.
+
+        @param url: url of an indexed document.
+        @return list of alias urls, empty if it has none.
+        """
+        with self.lock:
+            return list(self.aliases.get(url, ()))
+
+    def take_orphans(self):
+        """
+        Return the aliases whose document was replaced or removed since the last call, and forget them.
+
+        Their documents are no longer in the index in any form, so they should be added again; each one is either
+        indexed on its own or folded into whichever document it is now a near-duplicate of.
+
+        @param N/A
+        @return list of urls that are neither indexed nor an alias.
+        """
+        with self.lock:
+            orphans = [url for url in dict.fromkeys(self.orphans) if url not in self.locations and url not in self.canonical]
+            self.orphans = []
+            return orphans
+
+    def remove_documents(self, urls):
+        """
+        Tombstone documents so they no longer appear in results or count towards document frequencies.
+
+        @param urls: list of urls to remove. Urls that are not indexed are ignored. Aliases of removed documents become orphans.
+        @return N/A
+        """
+        with self.lock:
+            for url in urls:
+                self._remove(url)
+            self._maybe_merge()
+
+    def search(self, query, k):
+        """
+        Score every live document against the query with cosine similarity of tfidf vectors.
+
+        @param query: cleaned query string. k: maximum number of results.
+        @return list of (url, score) tuples with nonzero score, most similar first.
+        """
+        with self.lock:
+            idf, idf_version = self.get_idf()
+
+            q = np.zeros(len(self.vocabulary))
+            for t in tokenize(query):
+                if t in self.vocabulary:
+                    q[self.vocabulary[t]] += 1
+            q *= idf
+            q_norm = np.linalg.norm(q)
+            if q_norm == 0:
+                return []
+            q /= q_norm
+
+            urls = []
+            scores = []
+            for segment in self.segments:
+                n_terms = segment.counts.shape[1]
+                norms = segment.doc_norms(idf, idf_version)
+                # a float32 vector keeps scipy from converting the float32 counts to float64 on every query
+                dots = segment.counts @ (idf[:n_terms] * q[:n_terms]).astype(np.float32)
+                hits = np.flatnonzero((dots > 0) & segment.alive)
+                urls.extend(segment.urls[i] for i in hits)
+                scores.append(dots[hits] / norms[hits])
+
+        if not urls:
+            return []
+
+        scores = np.concatenate(scores)
+        return [(urls[i], float(scores[i])) for i in top_k(scores, k)]
+
+    def get_idf(self):
+        """
+        Return smoothed idf weights for the live documents, recomputing them from document frequencies if they changed.
+
+        Uses the same formula as TfidfVectorizer with smooth_idf=True: idf = ln((1 + n) / (1 + df)) + 1.
+
+        @param N/A
+        @return tuple of (idf vector, idf version).
+        """
+        with self.lock:
+            if self.idf_stale:
+                self.idf = np.log((1 + self.n_docs) / (1 + self.df[:len(self.vocabulary)])) + 1
+                self.idf_version += 1
+                self.idf_stale = False
+            return self.idf, self.idf_version
+
+    def save(self, path, shards=1, quantize=True):
+        """
+        Write the live documents to disk in the flat file format read by MappedIndex, along with their aliases.
+
+        The vocabulary and idf vector are computed over the whole corpus and written once, while documents are split
+        by a hash of their url into shards that each get their own postings and url table. Since every shard's weights
+        use the same global idf, scores do not depend on the number of shards. The index is written to a temporary
+        directory that then replaces path, so processes that already have the old files mapped keep reading a consistent copy.
+
+        Postings are compressed: the document ids of each term are stored as the gaps between them, varint encoded, and
+        weights are quantized to 8 bits, so an entry takes about 2 bytes instead of 12. Each term has one scale, taken
+        over the whole corpus before documents are split into shards, so quantized scores do not depend on the number of shards either.
+
+        @param path: directory to write the index to. shards: number of shards to split documents into.
+               quantize: store 8-bit weights; if False weights are stored as float32.
+        @return N/A
+        """
+        import scipy.sparse as sp
+
+        with self.lock:
+            idf, idf_version = self.get_idf()
+            vocabulary = dict(self.vocabulary)
+            parts = []
+            urls = []
+            for segment in self.segments:
+                keep = np.flatnonzero(segment.alive)
+                norms = segment.doc_norms(idf, idf_version)[keep]
+                part = segment.counts[keep].multiply(idf[:segment.counts.shape[1]]).multiply(1 / norms[:, None]).tocsr()
+                parts.append(sp.csr_matrix((part.data, part.indices, part.indptr), shape=(len(keep), len(vocabulary))))
+                urls.extend(segment.urls[i] for i in keep)
+            df = self.df[:len(vocabulary)].copy()
+            aliases = {url: list(links) for url, links in self.aliases.items()}
+
+        # keep only terms that still occur, ordered by their utf-8 bytes so MappedIndex can binary search them
+        terms = sorted((t.encode() for t, i in vocabulary.items() if df[i] > 0))
+        columns = np.array([vocabulary[t.decode()] for t in terms], dtype=np.int64)
+
+        if parts:
+            weights = sp.vstack(parts, format='csr')
+        else:
+            weights = sp.csr_matrix((0, len(vocabulary)))
+        parts = None
+        weights = weights[:, columns].tocsr()
+        scales = _scales(weights) if quantize else None
+
+        tmp = path + '.tmp'
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+
+        _write_strings(os.path.join(tmp, 'vocab'), terms)
+        idf[columns].astype(np.float64).tofile(os.path.join(tmp, 'idf.bin'))
+        if quantize:
+            scales.tofile(os.path.join(tmp, 'scales.bin'))
+
+        assignment = np.array([shard_of(u, shards) for u in urls], dtype=np.int64)
+        nnz = 0
+        for shard in range(shards):
+            rows = np.flatnonzero(assignment == shard)
+            # term-major postings: row t of the transposed matrix lists every document of this shard containing term t
+            postings = (weights if shards == 1 else weights[rows]).T.tocsr()
+            postings.sort_indices()
+            nnz += postings.nnz
+
+            directory = shard_dir(tmp, shard)
+            os.makedirs(directory)
+            _write_strings(os.path.join(directory, 'urls'), [urls[i].encode() for i in rows])
+            postings.indptr.astype(np.int64).tofile(os.path.join(directory, 'indptr.bin'))
+
+            offsets = _write_postings(os.path.join(directory, 'postings.bin'), postings.indices, postings.indptr)
+            offsets.tofile(os.path.join(directory, 'offsets.bin'))
+
+            if quantize:
+                _quantize(postings, scales).tofile(os.path.join(directory, 'weights.bin'))
+            else:
+                postings.data.astype(np.float32).tofile(os.path.join(directory, 'weights.bin'))
+
+        with open(os.path.join(tmp, 'aliases.json'), 'w') as f:
+            json.dump(aliases, f)
+
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'format': FORMAT, 'n_docs': len(urls), 'n_terms': len(terms), 'nnz': nnz, 'shards': shards,
+                       'weights': 'uint8' if quantize else 'float32', 'n_aliases': sum(len(links) for links in aliases.values())}, f)
+
+        old = path + '.old'
+        if os.path.exists(path):
+            os.rename(path, old)
+        os.rename(tmp, path)
+        if os.path.exists(old):
+            shutil.rmtree(old)
+
+    def compact(self):
+        """
+        Merge every segment into one, dropping all tombstoned rows. Waits for background merges to finish first.
+
+        @param N/A
+        @return N/A
+        """
+        self.wait()
+        with self.lock:
+            segments = list(self.segments)
+            self.merging.update(segments)
+        if len(segments) > 1 or self.n_dead > 0:
+            self._merge(segments)
+        else:
+            with self.lock:
+                self.merging.difference_update(segments)
+
+    def wait(self):
+        """
+        Block until all background merges have finished.
+
+        @param N/A
+        @return N/A
+        """
+        while True:
+            with self.lock:
+                threads = list(self.merge_threads)
+                self.merge_threads = []
+            if not threads:
+                return
+            for thread in threads:
+                thread.join()
+
+    def _term_id(self, term):
+        """
+        Return the column of a term, adding it to the vocabulary if it is new.
+
+        @param term: term to look up.
+        @return integer column index.
+        """
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            term_id = len(self.vocabulary)
+            self.vocabulary[term] = term_id
+            # the idf vector has one entry per term, even when the batch adding this term is folded into aliases
+            self.idf_stale = True
+            if term_id >= len(self.df):
+                self.df = np.concatenate([self.df, np.zeros(max(1024, len(self.df)), dtype=np.int64)])
+            if self.duplicates is not None:
+                if term_id >= len(self.term_hashes):
+                    self.term_hashes = np.concatenate([self.term_hashes, np.zeros(len(self.df) - len(self.term_hashes), dtype=np.uint64)])
+                self.term_hashes[term_id] = self.duplicates.term_hash(term)
+        return term_id
+
+    def _remove(self, url):
+        """
+        Tombstone the row holding url, if any, and take its terms out of the document frequencies. Caller holds the lock.
+
+        If url is an alias it is only detached from its document, and if it has aliases they become orphans.
+
+        @param url: url to remove.
+        @return N/A
+        """
+        original = self.canonical.pop(url, None)
+        if original is not None:
+            self.aliases[original].remove(url)
+            if not self.aliases[original]:
+                del self.aliases[original]
+            return
+
+        location = self.locations.pop(url, None)
+        if location is None:
+            return
+
+        if self.duplicates is not None:
+            self.duplicates.remove(url)
+            for alias in self.aliases.pop(url, ()):
+                del self.canonical[alias]
+                self.orphans.append(alias)
+
+        segment, row = location
+        segment.alive[row] = False
+        start, end = segment.counts.indptr[row], segment.counts.indptr[row + 1]
+        self.df[segment.counts.indices[start:end]] -= 1
+        self.n_docs -= 1
+        self.n_dead += 1
+        self.idf_stale = True
+
+    def _level(self, size):
+        """
+        Return the LSM level for a segment holding size documents.
+
+        @param size: number of rows in the segment.
+        @return integer level, 0 for segments up to base_size rows.
+        """
+        level = 0
+        capacity = self.base_size
+        while size > capacity:
+            capacity *= self.fan_in
+            level += 1
+        return level
+
+    def _maybe_merge(self):
+        """
+        Start a full compaction if too many rows are tombstoned, otherwise merge any level holding fan_in idle segments.
+
+        Caller holds the lock.
+
+        @param N/A
+        @return N/A
+        """
+        idle = [s for s in self.segments if s not in self.merging]
+
+        total = self.n_docs + self.n_dead
+        if total > 0 and self.n_dead / total > self.max_dead_ratio and len(idle) == len(self.segments):
+            self._start_merge(idle)
+            return
+
+        levels = {}
+        for segment in idle:
+            levels.setdefault(segment.level, []).append(segment)
+
+        for level in sorted(levels):
+            if len(levels[level]) >= self.fan_in:
+                self._start_merge(levels[level][:self.fan_in])
+
+    def _start_merge(self, segments):
+        """
+        Mark segments as merging and merge them in a background thread, or right away if background merging is off.
+
+        Caller holds the lock.
+
+        @param segments: list of segments to merge.
+        @return N/A
+        """
+        self.merging.update(segments)
+        if self.background:
+            thread = threading.Thread(target=self._merge, args=(segments,), daemon=True)
+            self.merge_threads.append(thread)
+            thread.start()
+        else:
+            self._merge(segments)
+
+    def _merge(self, segments):
+        """
+        Replace segments with a single segment holding only their live rows.
+
+        The new matrix is built without holding the lock so queries and updates keep running. Rows that were
+        tombstoned while the merge was in progress are tombstoned in the merged segment before it is swapped in.
+
+        @param segments: list of segments already marked as merging.
+        @return N/A
+        """
+        import scipy.sparse as sp
+
+        with self.lock:
+            rows = [np.flatnonzero(s.alive) for s in segments]
+
+        n_terms = max(s.counts.shape[1] for s in segments)
+        parts = []
+        urls = []
+        for segment, keep in zip(segments, rows):
+            part = segment.counts[keep]
+            parts.append(sp.csr_matrix((part.data, part.indices, part.indptr), shape=(len(keep), n_terms)))
+            urls.extend(segment.urls[i] for i in keep)
+
+        counts = sp.vstack(parts, format='csr') if parts else sp.csr_matrix((0, n_terms), dtype=np.float32)
+        merged = Segment(urls, counts, self._level(len(urls)))
+
+        with self.lock:
+            start = 0
+            for segment, keep in zip(segments, rows):
+                merged.alive[start:start + len(keep)] = segment.alive[keep]
+                start += len(keep)
+
+            for row in np.flatnonzero(merged.alive):
+                self.locations[urls[row]] = (merged, row)
+
+            # rows dropped by the merge are no longer tombstones
+            self.n_dead -= sum(len(s.urls) for s in segments) - len(urls)
+
+            self.segments = [s for s in self.segments if s not in segments]
+            if len(urls) > 0:
+                self.segments.append(merged)
+            self.merging.difference_update(segments)
+
+            self._maybe_merge()
+
+class MappedIndex:
+    """
+    Read-only TFIDF index opened from the flat files written by IncrementalIndex's save().
+
+    Every array is memory-mapped instead of read, so opening the index costs a few system calls no matter how large
+    it is, pages are only loaded when a query touches them, and several processes serving the same index share
+    one copy in the page cache. Postings are stored term-major, so a query only reads the postings of its own terms.
+    A sharded index is searched one shard after another; see ShardedIndex for searching shards in parallel.
+    """
+
+    def __init__(self, path, load_shards=True):
+        """
+        Constructor that maps the vocabulary and idf vector stored in path, and the postings and url table of every shard.
+
+        @param path: directory written by IncrementalIndex's save(). load_shards: also map the shards, not only the vocabulary.
+        @return N/A. Raises IndexFormatError if the index is in a format that cannot be read.
+        """
+        self.path = path
+
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+
+        saved = self.meta.get('format', 0)
+        if not OLDEST_FORMAT <= saved <= FORMAT:
+            raise IndexFormatError(path + ' holds an index in format ' + str(saved) + ', but only formats ' + str(OLDEST_FORMAT)
+                                   + ' to ' + str(FORMAT) + ' can be read; delete it and train a new index')
+
+        self.n_docs = self.meta['n_docs']
+        self.vocab = _StringTable(os.path.join(path, 'vocab'))
+        self.idf = _map_array(os.path.join(path, 'idf.bin'), np.float64)
+
+        self.shards = []
+        if load_shards:
+            self.shards = [MappedShard(shard_dir(path, shard), self.meta) for shard in range(self.meta['shards'])]
+        self.aliases = None
+
+    def __len__(self):
+        return self.n_docs
+
+    def aliases_of(self, url):
+        """
+        Return the urls of the near-duplicates folded into a document, reading aliases.json the first time.
+
+        @param url: url of an indexed document.
+        @return list of alias urls, empty if it has none or the index was saved without aliases.
+        """
+        if self.aliases is None:
+            path = os.path.join(self.path, 'aliases.json')
+            aliases = {}
+            if os.path.exists(path):
+                with open(path) as f:
+                    aliases = json.load(f)
+            self.aliases = aliases
+        return list(self.aliases.get(url, ()))
+
+    def term_id(self, term):
+        """
+        Binary search the sorted vocabulary for a term.
+
+        @param term: term to look up.
+        @return row of the term's postings, or None if the term is not in the vocabulary.
+        """
+        key = term.encode()
+        i = bisect.bisect_left(self.vocab, key)
+        if i < len(self.vocab) and self.vocab[i] == key:
+            return i
+        return None
+
+    def vectorize(self, query, term_ids=None):
+        """
+        Turn a query into its l2 normalized tfidf vector, stored sparsely.
+
+        @param query: cleaned query string. term_ids: optional dictionary remembering term lookups across many queries.
+        @return tuple of (term ids, weights) numpy arrays, both empty if no query term is in the vocabulary.
+        """
+        counts = Counter()
+        for t in tokenize(query):
+            if term_ids is None:
+                term_id = self.term_id(t)
+            elif t in term_ids:
+                term_id = term_ids[t]
+            else:
+                term_id = term_ids[t] = self.term_id(t)
+            if term_id is not None:
+                counts[term_id] += 1
+
+        if not counts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        term_ids = np.array(list(counts.keys()), dtype=np.int64)
+        q = np.array(list(counts.values()), dtype=np.float64) * self.idf[term_ids]
+        q /= np.linalg.norm(q)
+        return term_ids, q
+
+    def search(self, query, k):
+        """
+        Score documents against the query with cosine similarity of tfidf vectors, reading only the query terms' postings.
+
+        @param query: cleaned query string. k: maximum number of results.
+        @return list of (url, score) tuples with nonzero score, most similar first.
+        """
+        term_ids, q = self.vectorize(query)
+        if len(term_ids) == 0:
+            return []
+
+        results = []
+        for shard in self.shards:
+            results.extend(shard.search(term_ids, q, k))
+        return merge_results(results, k)
+
+    def search_batch(self, queries, k, chunk_size=1024):
+        """
+        Score many queries at once with one sparse matrix-matrix product per chunk of queries and shard.
+
+        Queries are vectorized into a sparse (queries x terms) matrix and multiplied by each shard's (terms x documents)
+        postings, chunk_size queries at a time so the product never holds more than chunk_size rows of scores.
+
+        @param queries: list of cleaned query strings. k: maximum number of results per query. chunk_size: queries scored per product.
+        @return generator of lists of (url, score) tuples, one list per query in the same order as queries.
+        """
+        import scipy.sparse as sp
+
+        postings = [shard.matrix(len(self.vocab)) for shard in self.shards]
+        term_ids = {}
+
+        for start in range(0, len(queries), chunk_size):
+            chunk = queries[start:start + chunk_size]
+
+            indices = []
+            data = []
+            indptr = [0]
+            for query in chunk:
+                ids, q = self.vectorize(query, term_ids)
+                indices.extend(ids)
+                data.extend(q)
+                indptr.append(len(indices))
+
+            q_matrix = sp.csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr)),
+                                     shape=(len(chunk), len(self.vocab)))
+
+            results = [[] for query in chunk]
+            for shard, matrix in zip(self.shards, postings):
+                scores = (q_matrix @ matrix).tocsr()
+                for i in range(len(chunk)):
+                    row_start, row_end = scores.indptr[i], scores.indptr[i + 1]
+                    row = scores.data[row_start:row_end]
+                    docs = scores.indices[row_start:row_end]
+                    results[i].extend((shard.urls[docs[j]].decode(), float(row[j])) for j in top_k(row, k))
+
+            for r in results:
+                yield merge_results(r, k)
+
+class MappedShard:
+    """
+    Memory-mapped postings and url table of one shard of a saved index.
+
+    The compressed postings are decoded one term at a time, so a query only decodes the postings of its own terms.
+    """
+
+    def __init__(self, path, meta):
+        """
+        Constructor that maps the postings and url table stored in a shard directory.
+
+        @param path: shard directory inside a saved index. meta: contents of the index's meta.json.
+        @return N/A
+        """
+        self.format = meta['format']
+        self.urls = _StringTable(os.path.join(path, 'urls'))
+        self.indptr = _map_array(os.path.join(path, 'indptr.bin'), np.int64)
+
+        if self.format < 3:
+            self.data = _map_array(os.path.join(path, 'data.bin'), np.float64)
+            self.indices = _map_array(os.path.join(path, 'indices.bin'), np.int32)
+            return
+
+        self.postings = _map_array(os.path.join(path, 'postings.bin'), np.uint8)
+        self.offsets = _map_array(os.path.join(path, 'offsets.bin'), np.int64)
+        self.scales = None
+        if meta['weights'] == 'uint8':
+            self.weights = _map_array(os.path.join(path, 'weights.bin'), np.uint8)
+            # the scales are shared by every shard; early format 3 indexes kept one set in each shard directory
+            scales = os.path.join(path, 'scales.bin')
+            if not os.path.exists(scales):
+                scales = os.path.join(os.path.dirname(path), 'scales.bin')
+            self.scales = _map_array(scales, np.float32)
+        else:
+            self.weights = _map_array(os.path.join(path, 'weights.bin'), np.float32)
+
+    def __len__(self):
+        return len(self.urls)
+
+    def term_postings(self, term_id):
+        """
+        Decode the postings of one term.
+
+        @param term_id: row of the term in the index's vocabulary.
+        @return tuple of (document ids, weights) numpy arrays.
+        """
+        start, end = self.indptr[term_id], self.indptr[term_id + 1]
+        if self.format < 3:
+            return self.indices[start:end], self.data[start:end]
+
+        ids = np.cumsum(_decode_varints(self.postings[self.offsets[term_id]:self.offsets[term_id + 1]]))
+        if self.scales is None:
+            return ids, self.weights[start:end]
+        return ids, self.weights[start:end] * self.scales[term_id]
+
+    def matrix(self, n_terms):
+        """
+        Wrap this shard's postings in a scipy sparse matrix for matrix-matrix scoring, decoding them all at once.
+
+        @param n_terms: number of terms in the index's vocabulary.
+        @return scipy csr matrix of weights (terms x documents).
+        """
+        import scipy.sparse as sp
+
+        if self.format < 3:
+            return sp.csr_matrix((self.data, self.indices, self.indptr), shape=(n_terms, len(self.urls)))
+
+        # a running sum over every term's gaps, minus the sum reached before the term's first id
+        gaps = _decode_varints(self.postings)
+        ids = np.cumsum(gaps)
+        counts = np.diff(self.indptr)
+        ids -= np.repeat(np.concatenate([[0], ids])[self.indptr[:-1]], counts)
+
+        data = self.weights
+        if self.scales is not None:
+            data = data * np.repeat(self.scales, counts)
+        return sp.csr_matrix((data, ids.astype(np.int32), self.indptr), shape=(n_terms, len(self.urls)))
+
+    def search(self, term_ids, q, k):
+        """
+        Score this shard's documents against a vectorized query.
+
+        @param term_ids: numpy array of query term ids. q: numpy array of their l2 normalized tfidf weights. k: maximum number of results.
+        @return list of this shard's (url, score) tuples with nonzero score, most similar first.
+        """
+        # document rows are already l2 normalized, so accumulating the dot product gives the cosine similarity
+        scores = np.zeros(len(self.urls))
+        for term_id, w in zip(term_ids, q):
+            ids, weights = self.term_postings(term_id)
+            scores[ids] += w * weights
+
+        return [(self.urls[i].decode(), float(scores[i])) for i in top_k(scores, k)]
+
+class _StringTable:
+    """
+    Sequence of byte strings stored as one buffer plus an array of offsets, both memory-mapped.
+
+    Supports len() and indexing, which is all bisect needs to binary search a sorted table.
+    """
+
+    def __init__(self, prefix):
+        self.buffer = _map_bytes(prefix + '.bin')
+        self.offsets = _map_array(prefix + '.off', np.int64)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]]
+
+def _write_strings(prefix, strings):
+    """
+    Write byte strings as a _StringTable: the concatenated bytes to prefix.bin and the offsets to prefix.off.
+
+    @param prefix: path without extension. strings: list of byte strings.
+    @return N/A
+    """
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in strings])
+    with open(prefix + '.bin', 'wb') as f:
+        f.write(b''.join(strings))
+    offsets.tofile(prefix + '.off')
+
+def _write_postings(path, ids, indptr, chunk_size=1 << 20):
+    """
+    Write the sorted document ids of every term as varint encoded gaps, chunk_size ids at a time so the temporary
+    arrays stay small. The first id of every term is stored as is, the rest as the gap from the previous id.
+
+    @param path: file to write. ids: numpy array of document ids, sorted within each term. indptr: positions in ids
+           where each term's postings start, plus the end. chunk_size: ids encoded at once.
+    @return int64 numpy array of the byte offset of every indptr position in the file.
+    """
+    starts = indptr[:-1][np.diff(indptr) > 0]
+    offsets = np.zeros(len(indptr), dtype=np.int64)
+    written = 0
+
+    with open(path, 'wb') as f:
+        for begin in range(0, len(ids), chunk_size):
+            end = min(begin + chunk_size, len(ids))
+            gaps = np.diff(ids[max(begin - 1, 0):end].astype(np.int64))
+            if begin == 0:
+                gaps = np.concatenate([ids[:1].astype(np.int64), gaps])
+            first = starts[(starts >= begin) & (starts < end)]
+            gaps[first - begin] = ids[first]
+
+            encoded, positions = _encode_varints(gaps)
+            encoded.tofile(f)
+
+            inside = (indptr >= begin) & (indptr < end)
+            offsets[inside] = written + positions[indptr[inside] - begin]
+            written += positions[-1]
+
+    offsets[indptr >= len(ids)] = written
+    return offsets
+
+def _encode_varints(values):
+    """
+    Encode non-negative integers as varints: 7 bits per byte, low bits first, with the high bit set on every byte but
+    the last of each value.
+
+    @param values: numpy int64 array of values.
+    @return tuple of (uint8 numpy array of encoded bytes, int64 numpy array of the byte offset of every value, plus the end).
+    """
+    lengths = np.ones(len(values), dtype=np.int64)
+    rest = values >> 7
+    while rest.any():
+        lengths += rest > 0
+        rest >>= 7
+
+    positions = np.zeros(len(values) + 1, dtype=np.int64)
+    positions[1:] = np.cumsum(lengths)
+
+    # position of every byte within its value
+    shift = np.arange(positions[-1]) - np.repeat(positions[:-1], lengths)
+    encoded = ((np.repeat(values, lengths) >> (7 * shift)) & 0x7f).astype(np.uint8)
+    encoded[shift < np.repeat(lengths - 1, lengths)] |= 0x80
+    return encoded, positions
+
+def _decode_varints(encoded):
+    """
+    Decode a buffer of varints written by _encode_varints() with numpy array operations instead of a loop over bytes.
+
+    @param encoded: uint8 numpy array of whole varints.
+    @return int64 numpy array of values.
+    """
+    last = encoded < 0x80
+    # gaps in dense postings nearly always fit in one byte
+    if last.all():
+        return encoded.astype(np.int64)
+
+    ends = np.flatnonzero(last)
+    starts = np.zeros(len(ends), dtype=np.int64)
+    starts[1:] = ends[:-1] + 1
+    position = np.arange(len(encoded)) - np.repeat(starts, ends - starts + 1)
+    return np.add.reduceat((encoded & 0x7f).astype(np.int64) << (7 * position), starts)
+
+def _scales(weights):
+    """
+    Compute the 8-bit quantization scale of every term, so the term's largest weight in any document becomes 255.
+
+    @param weights: scipy csr matrix of weights (documents x terms).
+    @return float32 numpy array of the weight of code 1 for every term.
+    """
+    if weights.nnz == 0:
+        return np.zeros(weights.shape[1], dtype=np.float32)
+    return (weights.max(axis=0).toarray().ravel() / 255).astype(np.float32)
+
+def _quantize(postings, scales):
+    """
+    Quantize the weights of every term to 8 bits with the given scales. Nonzero weights never round to 0, so a document
+    keeps matching every term it contains.
+
+    @param postings: scipy csr matrix of weights (terms x documents). scales: scale of every term, see _scales().
+    @return uint8 numpy array of codes, in the order of postings.data.
+    """
+    codes = postings.data / np.repeat(scales, np.diff(postings.indptr))
+    np.rint(codes, out=codes)
+    np.clip(codes, 1, 255, out=codes)
+    return codes.astype(np.uint8)
+
+def _map_bytes(path):
+    """
+    Memory-map a file read-only.
+
+    @param path: file to map.
+    @return mmap object, or empty bytes for an empty file since mmap cannot map zero bytes.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _map_array(path, dtype):
+    """
+    Memory-map a file of raw values as a numpy array without copying it.
+
+    @param path: file to map. dtype: numpy type of the stored values.
+    @return read-only numpy array backed by the file.
+    """
+    return np.frombuffer(_map_bytes(path), dtype=dtype)
@@ -0,0 +1,67 @@
+"""
+Regression check for IncrementalIndex.
+
+Builds small indexes in memory and checks cases that once broke searching, such as a batch of near-duplicates that adds
+new terms to the vocabulary but is folded into aliases without adding a row. Needs NumPy and SciPy, but no network
+access or saved index.
+
+From this directory run:
+'python3 index_check.py'
+"""
+
+from index import IncrementalIndex
+
+# a page long enough that one extra word keeps a copy of it a near-duplicate
+PAGE = ' '.join('term' + str(i) for i in range(200))
+
+def check_folded_new_term():
+    """
+    Add a near-duplicate of an indexed page that has one word no other page has, then search.
+
+    Every term the duplicate adds to the vocabulary must leave the idf vector stale, even though no row is added,
+    or the next query vector is longer than the cached idf.
+
+    @param N/A
+    @return list of failure messages, empty if the check passed.
+    """
+    index = IncrementalIndex(background=False)
+    index.add_documents(['http://a.utk.edu/1', 'http://a.utk.edu/2'], [PAGE, 'an unrelated page about something else'])
+    index.search('term5', 5)
+
+    index.add_documents(['http://a.utk.edu/3'], [PAGE + ' brandnew'])
+
+    failures = []
+    if index.aliases_of('http://a.utk.edu/1') != ['http://a.utk.edu/3']:
+        failures.append('near-duplicate was not folded into the page it copies')
+
+    try:
+        results = index.search('term5', 5)
+        new_term = index.search('brandnew', 5)
+    except ValueError as e:
+        return failures + ['search after folding a near-duplicate with a new term raised ValueError: ' + str(e)]
+
+    if [url for url, score in results] != ['http://a.utk.edu/1']:
+        failures.append('search after folding returned ' + str(results))
+    if new_term:
+        failures.append('a term only the folded duplicate has matched ' + str(new_term))
+    return failures
+
+def main():
+    """
+    Run every check and exit with status 1 if any failed.
+
+    @param N/A
+    @return N/A
+    """
+    failures = []
+    for check in [check_folded_new_term]:
+        failures.extend(check.__name__ + ': ' + failure for failure in check())
+
+    if failures:
+        for failure in failures:
+            print('FAIL: ' + failure)
+        exit(1)
+    print('OK')
+
+if __name__ == '__main__':
+    main()
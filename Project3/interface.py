@@ -3,8 +3,10 @@ class SearchInterface:
     Implements methods that create an interface for interacting with EECS search engine.
 
     listen() method for prompting for user input, unless "Command Mode" is specified, in
-    which case the provided query is passed to the engine. handle_input() method routes
-    commands to appropriate handlers; handles commands such as :train, :delete, and :exit.
+    which case the provided query is passed to the engine, "Batch Mode", in which case
+    the engine answers every query in a file, or "Server Mode", in which case the engine
+    serves queries over HTTP until interrupted. handle_input() method routes
+    commands to appropriate handlers; handles commands such as :train, :update, :stats, :delete, and :exit.
     """
     
     def __init__(self, mode, engine, query):
@@ -33,6 +35,15 @@ class SearchInterface:
         # command mode
         if self.mode == 'C':
             self.engine.handle_query()
+            self.engine.save_metrics()
+
+        # batch mode
+        elif self.mode == 'B':
+            self.engine.handle_batch()
+
+        # server mode
+        elif self.mode == 'S':
+            self.engine.serve()
         
         # interactive mode
         elif self.mode == 'I':
@@ -50,8 +61,9 @@ class SearchInterface:
         Handle input passed from listen().
 
         :delete calls SearchEngine's delete() that removes all pickle files, :train calls SearchEngine's train() to perform
-        tfidf training (potentially calling collect(), crawl(), and clean()), and :exit exits the program. Queries are sent
-        to SearchEngine's handle_query.
+        tfidf training (potentially calling collect(), crawl(), and clean()), :update <url> ... calls SearchEngine's update()
+        to re-crawl only the given urls, :stats [file] prints the engine's metrics or writes them to a file, and :exit writes
+        the metrics to the -metrics file and exits the program. Queries are sent to SearchEngine's handle_query.
 
         @param N/A
         @return N/A
@@ -62,7 +74,19 @@ class SearchInterface:
         elif self.query == ':train':
             self.engine.train()
 
+        elif self.query.startswith(':update'):
+            links = self.query.split()[1:]
+            if len(links) == 0:
+                print('ERROR: Missing links to update')
+            else:
+                self.engine.update(links)
+
+        elif self.query == ':stats' or self.query.startswith(':stats '):
+            args = self.query.split()[1:]
+            self.engine.stats(args[0] if args else None)
+
         elif self.query == ':exit':
+            self.engine.save_metrics()
             exit()
 
         else:
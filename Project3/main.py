@@ -2,10 +2,13 @@
 Author: Zachery Creech.
 
 This program is a simple search engine in the terminal that returns webpages from the utk.edu domain relevant to a user's query using
-BeautifulSoup4 and urllib3 to scrape webpages and Scikit-Learn and Pandas to perform TFIDF vectorization, then calculate cosine similarity.
+BeautifulSoup4 and urllib3 to scrape webpages and NumPy and SciPy to maintain an incremental TFIDF index, then calculate cosine similarity.
 In interactive mode, the user is prompted for queries in a terminal interface. This terminal interface also accepts administrative commands.
-The program is split into four files: main.py that processes command line arguments and creates the engine; engine.py that implements
-the SearchEngine class; crawler.py that implements the WebCrawler class; and interface.py that implements the SearchInterface class.
+The program is split into twelve files: main.py that processes command line arguments and creates the engine; engine.py that implements
+the SearchEngine class; crawler.py that implements the WebCrawler class; interface.py that implements the SearchInterface class;
+index.py that implements the IncrementalIndex class; cache.py that implements the QueryCache class; pipeline.py that implements
+the CrawlPipeline class; shards.py that implements the ShardedIndex class; server.py that implements the SearchServer class; metrics.py that implements
+the Metrics class; dedup.py that implements the DuplicateDetector class; and scheduler.py that implements the CrawlScheduler class.
 """
 
 import sys
@@ -33,6 +36,15 @@ def main():
     parser.add_argument('-mode')
     parser.add_argument('-query')
     parser.add_argument('-verbose')
+    parser.add_argument('-shards')
+    parser.add_argument('-queries')
+    parser.add_argument('-output')
+    parser.add_argument('-port')
+    parser.add_argument('-metrics')
+    parser.add_argument('-depth')
+    parser.add_argument('-max-pages')
+    parser.add_argument('-max-seconds')
+    parser.add_argument('-max-bytes')
 
     args = parser.parse_args()
 
@@ -40,7 +52,7 @@ def main():
         print('ERROR: Invalid arguments provided')
         exit()
 
-    if args.mode != 'C' and args.mode != 'I':
+    if args.mode != 'C' and args.mode != 'I' and args.mode != 'B' and args.mode != 'S':
         print('ERROR: Invalid arguments provided')
         exit()
 
@@ -48,6 +60,10 @@ def main():
         print('ERROR: Missing query argument')
         exit()
 
+    if args.mode == 'B' and args.queries == None:
+        print('ERROR: Missing queries argument')
+        exit()
+
     if args.mode == 'I' and args.verbose == None:
         print('ERROR: Missing verbose argument')
         exit()
@@ -57,7 +73,33 @@ def main():
             print('ERROR: Invalid arguments provided')
             exit()
 
-    main_engine = SearchEngine(args.mode, args.verbose, args.query, args.root, 1)
+    if args.shards != None:
+        if not args.shards.isdigit() or int(args.shards) < 1:
+            print('ERROR: Invalid arguments provided')
+            exit()
+
+    if args.port != None and not args.port.isdigit():
+        print('ERROR: Invalid arguments provided')
+        exit()
+
+    for value in (args.depth, args.max_pages, args.max_bytes):
+        if value != None and not value.isdigit():
+            print('ERROR: Invalid arguments provided')
+            exit()
+
+    if args.max_seconds != None and not args.max_seconds.replace('.', '', 1).isdigit():
+        print('ERROR: Invalid arguments provided')
+        exit()
+
+    shards = None if args.shards == None else int(args.shards)
+    port = None if args.port == None else int(args.port)
+    depth = 1 if args.depth == None else int(args.depth)
+    max_pages = None if args.max_pages == None else int(args.max_pages)
+    max_seconds = None if args.max_seconds == None else float(args.max_seconds)
+    max_bytes = None if args.max_bytes == None else int(args.max_bytes)
+
+    main_engine = SearchEngine(args.mode, args.verbose, args.query, args.root, depth, shards, args.queries, args.output, port, args.metrics,
+                               max_pages, max_seconds, max_bytes)
 
 if __name__ == '__main__':
     main()
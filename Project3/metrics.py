@@ -0,0 +1,287 @@
+import json
+import time
+import threading
+from collections import deque
+
+# upper bounds in seconds of the latency histogram buckets
+BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+# most recent observations kept per histogram for percentiles
+SAMPLES = 10000
+# prefix of every metric name in the Prometheus text format
+PREFIX = 'search_'
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets, plus a bounded window of recent observations for percentiles.
+    """
+
+    def __init__(self):
+        """
+        Constructor that creates an empty histogram.
+
+        @param N/A
+        @return N/A
+        """
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=SAMPLES)
+
+    def observe(self, value):
+        """
+        Record one observation.
+
+        @param value: observed latency in seconds.
+        @return N/A
+        """
+        i = 0
+        while i < len(BUCKETS) and value > BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def percentile(self, p):
+        """
+        Return a percentile of the recent observations, using the nearest-rank method.
+
+        @param p: percentile from 0 to 100.
+        @return observed value at that percentile, or 0 if nothing was observed.
+        """
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        rank = max(1, -(-len(ordered) * p // 100))
+        return ordered[int(rank) - 1]
+
+class Metrics:
+    """
+    Thread-safe registry of counters, gauges, and latency histograms for the crawler, index, and queries.
+
+    Counters and histograms may carry labels, such as the HTTP status of a failed download. The current values
+    can be printed for the ':stats' command with report(), or written to a file as JSON or in the Prometheus text
+    format with dump().
+    """
+
+    def __init__(self):
+        """
+        Constructor that creates an empty registry.
+
+        @param N/A
+        @return N/A
+        """
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def count(self, name, n=1, labels=None):
+        """
+        Add to a counter.
+
+        @param name: counter name. n: amount to add. labels: optional dictionary of label names to values.
+        @return N/A
+        """
+        key = (name, _freeze(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def set(self, name, value):
+        """
+        Set a gauge.
+
+        @param name: gauge name. value: new value.
+        @return N/A
+        """
+        with self.lock:
+            self.gauges[(name, ())] = value
+
+    def observe(self, name, seconds, labels=None):
+        """
+        Record one latency observation in a histogram.
+
+        @param name: histogram name. seconds: observed latency. labels: optional dictionary of label names to values.
+        @return N/A
+        """
+        key = (name, _freeze(labels))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(seconds)
+
+    def timer(self, name, labels=None):
+        """
+        Return a context manager that records the time spent inside it in a histogram.
+
+        @param name: histogram name. labels: optional dictionary of label names to values.
+        @return context manager.
+        """
+        return _Timer(self, name, labels)
+
+    def get(self, name, labels=None):
+        """
+        Return the current value of a counter or gauge.
+
+        @param name: counter or gauge name. labels: optional dictionary of label names to values.
+        @return current value, or 0 if it was never recorded.
+        """
+        key = (name, _freeze(labels))
+        with self.lock:
+            if key in self.gauges:
+                return self.gauges[key]
+            return self.counters.get(key, 0)
+
+    def snapshot(self):
+        """
+        Return every metric as a JSON-serializable dictionary.
+
+        @param N/A
+        @return dictionary with 'counters', 'gauges', and 'histograms' keys.
+        """
+        with self.lock:
+            counters = {_name(k): v for k, v in sorted(self.counters.items())}
+            gauges = {_name(k): v for k, v in sorted(self.gauges.items())}
+            histograms = {}
+            for key, h in sorted(self.histograms.items()):
+                histograms[_name(key)] = {'count': h.count, 'sum': h.sum, 'mean': h.sum / h.count if h.count else 0.0,
+                                          'p50': h.percentile(50), 'p99': h.percentile(99)}
+
+        return {'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+    def report(self):
+        """
+        Format every metric as human-readable lines for the ':stats' command.
+
+        @param N/A
+        @return list of strings.
+        """
+        snap = self.snapshot()
+        lines = []
+
+        for name, value in snap['counters'].items():
+            lines.append(name + ': ' + str(value))
+
+        for name, value in snap['gauges'].items():
+            lines.append(name + ': ' + (str('{:.3f}'.format(value)) if isinstance(value, float) else str(value)))
+
+        for name, h in snap['histograms'].items():
+            lines.append(name + ': count ' + str(h['count']) + ', mean ' + _ms(h['mean']) + ', p50 ' + _ms(h['p50']) + ', p99 ' + _ms(h['p99']))
+
+        return lines
+
+    def prometheus(self):
+        """
+        Format every metric in the Prometheus text exposition format.
+
+        @param N/A
+        @return string.
+        """
+        lines = []
+
+        with self.lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                metric = PREFIX + name + '_total'
+                if metric not in typed:
+                    lines.append('# TYPE ' + metric + ' counter')
+                    typed.add(metric)
+                lines.append(metric + _labels(labels) + ' ' + str(value))
+
+            for (name, labels), value in sorted(self.gauges.items()):
+                lines.append('# TYPE ' + PREFIX + name + ' gauge')
+                lines.append(PREFIX + name + ' ' + str(value))
+
+            for (name, labels), h in sorted(self.histograms.items()):
+                metric = PREFIX + name
+                if metric not in typed:
+                    lines.append('# TYPE ' + metric + ' histogram')
+                    typed.add(metric)
+
+                cumulative = 0
+                for bound, n in zip(BUCKETS + ['+Inf'], h.counts):
+                    cumulative += n
+                    lines.append(metric + '_bucket' + _labels(labels + (('le', str(bound)),)) + ' ' + str(cumulative))
+                lines.append(metric + '_sum' + _labels(labels) + ' ' + str(h.sum))
+                lines.append(metric + '_count' + _labels(labels) + ' ' + str(h.count))
+
+                for p in (50, 99):
+                    lines.append(metric + '_p' + str(p) + _labels(labels) + ' ' + str(h.percentile(p)))
+
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """
+        Write every metric to a file, in the Prometheus text format if the file name ends in '.prom', otherwise as JSON.
+
+        @param path: file to write.
+        @return N/A
+        """
+        if path.endswith('.prom'):
+            text = self.prometheus()
+        else:
+            text = json.dumps(self.snapshot(), indent=2) + '\n'
+
+        with open(path, 'w') as f:
+            f.write(text)
+
+class _Timer:
+    """
+    Context manager returned by Metrics' timer().
+    """
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        self.metrics.observe(self.name, self.elapsed, self.labels)
+        return False
+
+def timed_call(func, arg):
+    """
+    Call func(arg) and measure how long it took. Module level so it can run in a ProcessPoolExecutor worker.
+
+    @param func: module level function to call. arg: its argument.
+    @return tuple of (result, seconds).
+    """
+    start = time.perf_counter()
+    result = func(arg)
+    return result, time.perf_counter() - start
+
+def _freeze(labels):
+    """
+    Turn a labels dictionary into a sorted tuple usable as part of a dictionary key.
+    """
+    if not labels:
+        return ()
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _name(key):
+    """
+    Format a (name, labels) key as 'name{label=value,...}'.
+    """
+    name, labels = key
+    if not labels:
+        return name
+    return name + '{' + ','.join(k + '=' + v for k, v in labels) + '}'
+
+def _labels(labels):
+    """
+    Format labels in the Prometheus text format.
+    """
+    if not labels:
+        return ''
+    return '{' + ','.join(k + '="' + v + '"' for k, v in labels) + '}'
+
+def _ms(seconds):
+    """
+    Format seconds as milliseconds.
+    """
+    return str('{:.3f}'.format(seconds * 1000)) + 'ms'
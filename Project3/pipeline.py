@@ -0,0 +1,222 @@
+import time
+import zlib
+import queue
+import pickle
+import threading
+from collections import deque
+from crawler import extract_text, clean_text, process_pool
+
+# marks the end of the stream on every queue
+DONE = None
+
+def extract_and_clean(html):
+    """
+    Extract and clean the text of one page. Runs in a ProcessPoolExecutor worker so the raw HTML never comes back.
+
+    @param html: raw bytes of a webpage.
+    @return tuple of (cleaned document string, seconds spent extracting, seconds spent cleaning).
+    """
+    start = time.perf_counter()
+    text = extract_text(html)
+    extracted = time.perf_counter()
+    doc = clean_text(text)
+    return doc, extracted - start, time.perf_counter() - extracted
+
+def write_document(f, link, doc):
+    """
+    Append one (url, cleaned document) record to an open docs.pickle, with the document compressed by zlib.
+
+    @param f: file opened for binary writing or appending. link: url of the document. doc: cleaned document.
+    @return N/A
+    """
+    pickle.dump((link, zlib.compress(doc.encode())), f)
+
+def read_documents(path, links=None):
+    """
+    Stream the (url, cleaned document) records stored in docs.pickle one at a time.
+
+    Also reads records with uncompressed documents, and the older format where docs.pickle holds one list of
+    documents in the same order as links.pickle.
+    Later records for a url replace earlier ones when they are added to an IncrementalIndex in order.
+
+    @param path: path of docs.pickle. links: list of links loaded from links.pickle, only needed by the older format.
+    @return generator of (url, cleaned document) tuples.
+    """
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                record = pickle.load(f)
+            except EOFError:
+                return
+
+            if isinstance(record, list):
+                if links is None:
+                    raise ValueError(path + ' holds documents in the older list format, which needs links.pickle')
+                yield from zip(links, record)
+            elif isinstance(record[1], bytes):
+                yield record[0], zlib.decompress(record[1]).decode()
+            else:
+                yield record
+
+class CrawlPipeline:
+    """
+    Streams pages from download through extraction and cleaning, yielding cleaned documents as soon as they are ready.
+
+    Stages are connected by bounded queues, so a slow stage blocks the stages feeding it instead of letting pages pile
+    up in memory: links are pulled from the source only as fast as fetch_workers threads can download them, at most
+    max_in_flight downloaded pages wait for or sit in the extraction process pool, and raw HTML is dropped as soon as
+    its text has been extracted. Memory use therefore depends on the queue sizes, not on the size of the crawl.
+    """
+
+    def __init__(self, crawler, queue_size=64, max_in_flight=None):
+        """
+        Constructor that saves the crawler whose fetch() downloads pages and sizes the queues between stages.
+
+        @param crawler: WebCrawler instance, also supplies fetch_workers, parse_workers, and verbosity.
+               queue_size: capacity of each queue between stages. max_in_flight: pages submitted to the process pool at once.
+        @return N/A
+        """
+        self.crawler = crawler
+        self.queue_size = queue_size
+        self.max_in_flight = max_in_flight or 4 * crawler.parse_workers
+
+    def run(self, links):
+        """
+        Crawl, extract, and clean every link produced by links.
+
+        links may be a generator such as WebCrawler's iter_collect(), in which case crawling starts while links are still
+        being collected. Documents are yielded in the order their pages finish downloading, not in the order of links.
+
+        @param links: iterable of urls.
+        @return generator of (url, cleaned document) tuples; the document is empty if the page could not be downloaded.
+        """
+        self.error = None
+        link_queue = queue.Queue(self.queue_size)
+        page_queue = queue.Queue(self.queue_size)
+        doc_queue = queue.Queue(self.queue_size)
+        n_fetchers = self.crawler.fetch_workers
+
+        threads = [threading.Thread(target=self.feed, args=(links, link_queue, n_fetchers), daemon=True),
+                   threading.Thread(target=self.parse, args=(page_queue, doc_queue, n_fetchers), daemon=True)]
+        for i in range(n_fetchers):
+            threads.append(threading.Thread(target=self.fetch, args=(link_queue, page_queue), daemon=True))
+
+        for thread in threads:
+            thread.start()
+
+        while True:
+            item = doc_queue.get()
+            if item is DONE:
+                break
+            yield item
+
+        # errors raised in a stage thread, such as by the links generator, are raised again here; the other
+        # stages may be blocked on a full queue, so they are left to exit with the process
+        if self.error is not None:
+            raise self.error
+
+        for thread in threads:
+            thread.join()
+
+    def feed(self, links, link_queue, n_fetchers):
+        """
+        First stage: put every link on link_queue, then one DONE marker per fetch thread.
+
+        @param links: iterable of urls. link_queue: queue read by fetch(). n_fetchers: number of fetch threads.
+        @return N/A
+        """
+        try:
+            for link in links:
+                link_queue.put(link)
+        except Exception as err:
+            self.error = err
+        finally:
+            for i in range(n_fetchers):
+                link_queue.put(DONE)
+
+    def fetch(self, link_queue, page_queue):
+        """
+        Second stage, run by fetch_workers threads: download each link and pass the raw page on to parse().
+
+        A link whose download raises is passed on as a page that could not be downloaded, and DONE is always put on
+        page_queue when the thread exits, so parse() never waits for a fetch thread that died.
+
+        @param link_queue: queue of urls. page_queue: queue of (url, raw bytes or None) tuples.
+        @return N/A
+        """
+        try:
+            while True:
+                link = link_queue.get()
+                if link is DONE:
+                    return
+
+                try:
+                    html = self.crawler.fetch(link)
+                except Exception:
+                    self.crawler.metrics.count('fetch_errors', labels={'status': 'failed'})
+                    html = None
+
+                with self.crawler.lock:
+                    self.crawler.crawled += 1
+                    if self.crawler.verbosity == 'T':
+                        print('crawl(): [VERBOSE] CRAWLING: LINK (' + str(self.crawler.crawled) + '/' + str(self.crawler.collected) + ')')
+
+                page_queue.put((link, html))
+        finally:
+            page_queue.put(DONE)
+
+    def parse(self, page_queue, doc_queue, n_fetchers):
+        """
+        Third stage: extract and clean pages in a process pool, keeping at most max_in_flight pages submitted at once.
+
+        @param page_queue: queue of (url, raw bytes or None) tuples. doc_queue: queue of (url, cleaned document) tuples.
+               n_fetchers: number of DONE markers to expect on page_queue.
+        @return N/A
+        """
+        in_flight = deque()
+
+        try:
+            # the fetch threads are already running, so the workers must not be forked from this process; see process_pool()
+            with process_pool(self.crawler.parse_workers) as parsers:
+                while n_fetchers > 0:
+                    item = page_queue.get()
+                    if item is DONE:
+                        n_fetchers -= 1
+                        continue
+
+                    link, html = item
+                    if html is None:
+                        doc_queue.put((link, ''))
+                        continue
+
+                    in_flight.append((link, parsers.submit(extract_and_clean, html)))
+
+                    # wait for the oldest page before accepting more once the pool is full
+                    while len(in_flight) >= self.max_in_flight:
+                        self.finish(in_flight.popleft(), doc_queue)
+
+                while in_flight:
+                    self.finish(in_flight.popleft(), doc_queue)
+        except Exception as err:
+            self.error = err
+        finally:
+            doc_queue.put(DONE)
+
+    def finish(self, pending, doc_queue):
+        """
+        Wait for one submitted page, record its parse and clean times, and put its cleaned document on doc_queue.
+
+        @param pending: (url, future) tuple. doc_queue: queue of (url, cleaned document) tuples.
+        @return N/A
+        """
+        link, future = pending
+        metrics = self.crawler.metrics
+        try:
+            doc, parse_seconds, clean_seconds = future.result()
+            metrics.observe('parse_seconds', parse_seconds)
+            metrics.observe('clean_seconds', clean_seconds)
+        except Exception:
+            # a page BeautifulSoup cannot parse is treated like a page that could not be downloaded
+            metrics.count('parse_errors')
+            doc = ''
+        doc_queue.put((link, doc))
@@ -0,0 +1,159 @@
+import math
+import time
+import heapq
+from urllib.parse import urlsplit
+
+# words in a link's anchor text or path that suggest a page with content worth indexing
+KEYWORDS = ('about', 'academics', 'admissions', 'courses', 'directory', 'events', 'faculty', 'graduate', 'labs', 'news',
+            'people', 'programs', 'projects', 'publications', 'research', 'staff', 'undergraduate')
+# words that suggest a page without content worth indexing
+LOW_VALUE = ('calendar', 'feed', 'login', 'logout', 'print', 'share', 'wp-admin', 'wp-json', 'wp-login')
+# links to files that are never HTML are not downloaded at all
+SKIP_EXTENSIONS = ('.7z', '.avi', '.bmp', '.css', '.csv', '.doc', '.docx', '.exe', '.gif', '.gz', '.ico', '.ics', '.jpeg',
+                   '.jpg', '.js', '.json', '.m4a', '.mov', '.mp3', '.mp4', '.pdf', '.png', '.ppt', '.pptx', '.rss', '.svg',
+                   '.tar', '.tgz', '.wav', '.webm', '.webp', '.xls', '.xlsx', '.xml', '.zip')
+# markers of the sections WebCrawler extracts text from
+CONTENT_MARKERS = (b'entry-content', b'person_content', b'table_default')
+
+class CrawlScheduler:
+    """
+    Priority frontier of links to collect, with optional budgets on pages, seconds, and bytes downloaded.
+
+    Links are taken best first instead of level by level. A link's priority is its depth, made better by keywords in its
+    anchor text or path, by its page being linked from a page that had content sections, and by its host having
+    served pages with content sections before, and made worse by low value words and by how many pages were already
+    taken from its host. Host statistics change as the crawl goes on, so a link is scored again with the current
+    statistics when it reaches the front of the frontier, and put back if it is no longer the best. When a budget runs
+    out no more links are handed out, so a crawl cut short has spent its budget on the pages most likely to have text to index.
+    """
+
+    def __init__(self, max_pages=None, max_seconds=None, max_bytes=None):
+        """
+        Constructor that creates an empty frontier and saves the budgets.
+
+        @param max_pages: most links to hand out. max_seconds: most seconds after construction to keep handing out links.
+               max_bytes: most bytes downloaded before no more links are handed out. None means unlimited.
+        @return N/A
+        """
+        self.max_pages = max_pages
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+
+        self.frontier = []
+        self.seen = set()
+        self.taken = 0
+        self.counter = 0
+        # per host: [pages taken, pages fetched, pages with content sections]
+        self.hosts = {}
+        self.started = time.perf_counter()
+
+    def __len__(self):
+        return len(self.frontier)
+
+    def push(self, url, depth, anchor='', parent_has_content=False):
+        """
+        Add a link to the frontier unless it was seen before or points to a file that is not HTML.
+
+        @param url: absolute url. depth: number of links followed from the root to reach it. anchor: text of the link.
+               parent_has_content: whether the page linking to it had content sections.
+        @return 'added', 'seen', or 'skipped'.
+        """
+        if url in self.seen or url.rstrip('/') in self.seen:
+            return 'seen'
+        self.seen.add(url)
+
+        parts = urlsplit(url)
+        if parts.path.lower().endswith(SKIP_EXTENSIONS):
+            return 'skipped'
+
+        anchor = anchor.lower()
+        priority = self.priority(parts, depth, anchor, parent_has_content)
+        self.counter += 1
+        # the counter keeps links of equal priority in the order they were found
+        heapq.heappush(self.frontier, (priority, self.counter, url, depth, anchor, parent_has_content))
+        return 'added'
+
+    def pop(self):
+        """
+        Take the best link from the frontier, scored with the host statistics as they are now.
+
+        The priority a link was pushed with may be stale, since its host has supplied and fetched pages since then. The
+        front link is scored again, and if another link is now better it goes back in the frontier with its new priority.
+        A link that comes back to the front without anything changing keeps its priority, so this always ends.
+
+        @param N/A
+        @return tuple of (url, depth), or None if the frontier is empty.
+        """
+        while self.frontier:
+            stale, counter, url, depth, anchor, parent_has_content = heapq.heappop(self.frontier)
+            priority = self.priority(urlsplit(url), depth, anchor, parent_has_content)
+            # another link is better now, so put this one back with its current priority
+            if self.frontier and (priority, counter) > self.frontier[0][:2]:
+                heapq.heappush(self.frontier, (priority, counter, url, depth, anchor, parent_has_content))
+                continue
+
+            self.taken += 1
+            self.host(urlsplit(url).netloc)[0] += 1
+            return url, depth
+
+        return None
+
+    def record(self, url, page):
+        """
+        Remember whether a downloaded page had content sections, for the priority of its host's other pages.
+
+        @param url: url of the page. page: raw bytes of the page.
+        @return True if the page has content sections.
+        """
+        has_content = any(marker in page for marker in CONTENT_MARKERS)
+        stats = self.host(urlsplit(url).netloc)
+        stats[1] += 1
+        stats[2] += has_content
+        return has_content
+
+    def exhausted(self, bytes_fetched):
+        """
+        Check the budgets.
+
+        @param bytes_fetched: bytes downloaded by the crawl so far.
+        @return name of the budget that ran out, 'pages', 'seconds', or 'bytes', or None if none has.
+        """
+        if self.max_pages is not None and self.taken >= self.max_pages:
+            return 'pages'
+        if self.max_seconds is not None and time.perf_counter() - self.started >= self.max_seconds:
+            return 'seconds'
+        if self.max_bytes is not None and bytes_fetched >= self.max_bytes:
+            return 'bytes'
+        return None
+
+    def priority(self, parts, depth, anchor, parent_has_content):
+        """
+        Score a link, lower is better.
+
+        @param parts: urlsplit() of the link. depth: its depth. anchor: lowercase anchor text. parent_has_content: see push().
+        @return float priority.
+        """
+        text = anchor + ' ' + parts.path.lower()
+        priority = float(depth)
+        priority -= 0.5 * min(2, sum(word in text for word in KEYWORDS))
+        if any(word in text for word in LOW_VALUE):
+            priority += 1.0
+        if parent_has_content:
+            priority -= 0.5
+
+        taken, fetched, with_content = self.host(parts.netloc)
+        # smoothed share of the host's pages that had content, 0.5 for a host nothing was fetched from yet
+        priority -= 0.5 * (with_content + 1) / (fetched + 2)
+        priority += 0.1 * math.log2(1 + taken)
+        return priority
+
+    def host(self, netloc):
+        """
+        Return the statistics kept for a host, creating them the first time.
+
+        @param netloc: host and port of a url.
+        @return list of [pages taken, pages fetched, pages with content sections].
+        """
+        if netloc not in self.hosts:
+            self.hosts[netloc] = [0, 0, 0]
+        return self.hosts[netloc]
@@ -0,0 +1,142 @@
+import json
+import asyncio
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+# port the server listens on when -port is not given; client.py uses the same default
+DEFAULT_PORT = 8423
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+class SearchServer:
+    """
+    Long-running HTTP server on localhost that keeps a SearchEngine's index loaded and answers queries over it.
+
+    Connections are accepted by an asyncio event loop, and queries run in a pool of worker threads so several
+    clients are served at once. 'GET /search?q=<query>' returns the top five results as JSON, and 'POST /admin/train'
+    runs the engine's train() in a separate single thread, then hot-swaps the freshly built index: queries that
+    are already running finish on the old index, and every later query uses the new one. 'GET /stats' returns the
+    engine's metrics as JSON, and 'GET /metrics' returns them in the Prometheus text format.
+    """
+
+    def __init__(self, engine, port=None, workers=8):
+        """
+        Constructor that saves the engine that answers queries and the port to listen on.
+
+        @param engine: SearchEngine with an index already trained or saved. port: localhost port, DEFAULT_PORT if None.
+               workers: number of queries answered at the same time.
+        @return N/A
+        """
+        self.engine = engine
+        self.port = port or DEFAULT_PORT
+        self.workers = workers
+
+    def run(self):
+        """
+        Serve requests until the process is interrupted.
+
+        @param N/A
+        @return N/A
+        """
+        try:
+            asyncio.run(self.main())
+        except KeyboardInterrupt:
+            pass
+
+    async def main(self):
+        """
+        Start the worker pools and the listening socket.
+
+        @param N/A
+        @return N/A
+        """
+        self.loop = asyncio.get_running_loop()
+        self.query_pool = ThreadPoolExecutor(self.workers)
+        # training runs one at a time and never takes a query worker
+        self.admin_pool = ThreadPoolExecutor(1)
+
+        server = await asyncio.start_server(self.handle, '127.0.0.1', self.port)
+        print('serve(): LISTENING ON http://127.0.0.1:' + str(self.port))
+
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader, writer):
+        """
+        Read one HTTP request from a connection, answer it, and close the connection.
+
+        @param reader: asyncio StreamReader of the connection. writer: asyncio StreamWriter of the connection.
+        @return N/A
+        """
+        try:
+            method, target, version = (await reader.readline()).decode('latin-1').split()
+
+            # skip headers, and the body if there is one
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, sep, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            if length > 0:
+                await reader.readexactly(length)
+
+            status, body = await self.route(method, target)
+        except ValueError:
+            status, body = 400, {'error': 'malformed request'}
+        except Exception as err:
+            status, body = 500, {'error': str(err)}
+
+        # bodies are JSON, except the Prometheus text of /metrics
+        if isinstance(body, str):
+            data = body.encode()
+            content_type = 'text/plain; version=0.0.4'
+        else:
+            data = json.dumps(body).encode()
+            content_type = 'application/json'
+
+        writer.write(('HTTP/1.1 ' + str(status) + ' ' + REASONS[status] + '\r\n'
+                      'Content-Type: ' + content_type + '\r\n'
+                      'Content-Length: ' + str(len(data)) + '\r\n'
+                      'Connection: close\r\n\r\n').encode() + data)
+
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def route(self, method, target):
+        """
+        Dispatch a request to the search, metrics, or admin handler.
+
+        @param method: HTTP method. target: request path and query string.
+        @return tuple of (HTTP status, JSON-serializable body, or a string sent as plain text).
+        """
+        url = urlsplit(target)
+
+        if url.path == '/search':
+            if method != 'GET':
+                return 405, {'error': 'use GET'}
+
+            query = parse_qs(url.query).get('q', [''])[0]
+            results = await self.loop.run_in_executor(self.query_pool, self.engine.search, query)
+            return 200, {'query': query, 'results': [{'url': link, 'score': v, 'aliases': self.engine.aliases_of(link)} for link, v in results]}
+
+        if url.path == '/stats' or url.path == '/metrics':
+            if method != 'GET':
+                return 405, {'error': 'use GET'}
+
+            if url.path == '/stats':
+                return 200, self.engine.metrics.snapshot()
+            return 200, self.engine.metrics.prometheus()
+
+        if url.path == '/admin/train':
+            if method != 'POST':
+                return 405, {'error': 'use POST'}
+
+            await self.loop.run_in_executor(self.admin_pool, self.engine.train)
+            return 200, {'status': 'trained', 'documents': len(self.engine.searcher), 'version': self.engine.index_version}
+
+        return 404, {'error': 'unknown path'}
@@ -0,0 +1,139 @@
+import queue
+import multiprocessing
+from multiprocessing.connection import wait
+from index import MappedIndex, MappedShard, ClosedIndexError, shard_dir, merge_results
+
+def serve_shard(path, meta, conns):
+    """
+    Worker process loop: map one shard, then answer (term ids, weights, k) requests on any of its pipes until a None request arrives.
+
+    This is a module level function so it can be the target of a worker process.
+
+    @param path: shard directory inside a saved index. meta: contents of the index's meta.json.
+           conns: worker ends of the multiprocessing Pipes, one per channel.
+    @return N/A
+    """
+    shard = MappedShard(path, meta)
+
+    running = True
+    while running:
+        for conn in wait(conns):
+            request = conn.recv()
+            if request is None:
+                running = False
+                break
+
+            term_ids, q, k = request
+            conn.send(shard.search(term_ids, q, k))
+
+    for conn in conns:
+        conn.close()
+
+class ShardedIndex:
+    """
+    Searches a sharded saved index with one worker process per shard using scatter-gather.
+
+    The coordinator vectorizes the query once against the global vocabulary and idf, broadcasts it to every shard,
+    lets the shards score their own documents in parallel and return their local top k, and merges those into the
+    global top k. All shards share the idf computed over the whole corpus, so scores match an unsharded index.
+
+    Every worker has one pipe per channel, and a query holds a channel from its scatter to its gather, so replies are
+    never mixed up between queries while up to channels queries are in flight at once.
+    """
+
+    def __init__(self, path, channels=8):
+        """
+        Constructor that maps the global vocabulary and starts one worker process per shard.
+
+        Workers are started from a separate server process where the platform supports it, for the same reason as
+        the crawler's process_pool(): this process may be running other threads.
+
+        @param path: directory written by IncrementalIndex's save() with shards > 1.
+               channels: number of queries that can be searched at the same time.
+        @return N/A
+        """
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+        else:
+            context = multiprocessing.get_context()
+
+        self.index = MappedIndex(path, load_shards=False)
+        self.n_docs = len(self.index)
+        self.workers = []
+        self.free = queue.Queue()
+        for channel in range(channels):
+            self.free.put(channel)
+        self.channels = channels
+
+        for shard in range(self.index.meta['shards']):
+            conns, worker_conns = zip(*(context.Pipe() for channel in range(channels)))
+            process = context.Process(target=serve_shard, args=(shard_dir(path, shard), self.index.meta, list(worker_conns)), daemon=True)
+            process.start()
+            for conn in worker_conns:
+                conn.close()
+            self.workers.append((process, conns))
+
+    def __len__(self):
+        return self.n_docs
+
+    def aliases_of(self, url):
+        """
+        Return the urls of the near-duplicates folded into a document. See MappedIndex's aliases_of().
+
+        @param url: url of an indexed document.
+        @return list of alias urls.
+        """
+        return self.index.aliases_of(url)
+
+    def search(self, query, k):
+        """
+        Vectorize the query, score it on every shard in parallel, and merge the shards' results.
+
+        @param query: cleaned query string. k: maximum number of results.
+        @return list of (url, score) tuples with nonzero score, most similar first.
+        """
+        term_ids, q = self.index.vectorize(query)
+        if len(term_ids) == 0:
+            return []
+
+        results = []
+        channel = self.free.get()
+        try:
+            workers = self.workers
+            if not workers:
+                raise ClosedIndexError('ShardedIndex has been closed')
+
+            # scatter to every shard before gathering, so the shards score at the same time
+            for process, conns in workers:
+                conns[channel].send((term_ids, q, k))
+
+            for process, conns in workers:
+                results.extend(conns[channel].recv())
+        finally:
+            self.free.put(channel)
+
+        return merge_results(results, k)
+
+    def close(self):
+        """
+        Stop the worker processes once the queries already running on them have finished.
+
+        @param N/A
+        @return N/A
+        """
+        # holding every channel means no query is in flight
+        taken = [self.free.get() for channel in range(self.channels)]
+        workers = self.workers
+        self.workers = []
+
+        for process, conns in workers:
+            conns[0].send(None)
+            for conn in conns:
+                conn.close()
+
+        # queries waiting for a channel now find the index closed
+        for channel in taken:
+            self.free.put(channel)
+
+        for process, conns in workers:
+            process.join()
@@ -0,0 +1,100 @@
+"""
+Startup time check for command mode.
+
+Runs 'main.py -mode C' in a fresh interpreter several times against the saved index in the current directory and
+measures the import time of the engine, the latency of the first query (opening the index and answering it), and
+the wall time of the whole process. The check fails if the median wall time is over the budget, or if any module
+that only crawling or training needs was imported while answering the query.
+
+To run it, train an index first, then from the same directory run:
+'python3 startup_check.py -root <url> -query <search query> -budget <seconds> -runs <runs>'
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+# modules that answering a query from a saved index should never import
+HEAVY_MODULES = ['bs4', 'lxml', 'requests', 'sklearn', 'pandas', 'scipy', 'urllib.request', 'asyncio', 'multiprocessing']
+
+# run in the child interpreter: time importing the engine and answering one query in command mode
+CHILD = """
+import sys, io, json, time, contextlib
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+sys.argv = ['main.py', '-root', sys.argv[2], '-mode', 'C', '-query', sys.argv[3]]
+import main
+imported = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    main.main()
+answered = time.perf_counter()
+heavy = [m for m in sys.argv[4:] if m in sys.modules]
+print(json.dumps({'import': imported - start, 'query': answered - imported, 'heavy': heavy}))
+"""
+
+def measure(root, query):
+    """
+    Answer one query in a fresh interpreter and time it.
+
+    @param root: root url passed to main.py. query: query passed to main.py.
+    @return dictionary with import, query, and wall times in seconds, and the heavy modules that were imported.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', CHILD, here, root, query] + HEAVY_MODULES,
+                         capture_output=True, text=True, check=True).stdout
+    wall = time.perf_counter() - start
+
+    result = json.loads(out.strip().splitlines()[-1])
+    result['wall'] = wall
+    return result
+
+def main():
+    """
+    Parse arguments, measure startup several times, print the medians, and exit with status 1 if the check fails.
+
+    @param N/A
+    @return N/A
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-root', default='https://www.eecs.utk.edu')
+    parser.add_argument('-query', default='computer science')
+    parser.add_argument('-budget', type=float, default=0.5)
+    parser.add_argument('-runs', type=int, default=5)
+
+    args = parser.parse_args()
+
+    from index import readable
+
+    if not readable('index'):
+        print('ERROR: No saved index in a current format in the current directory, train one first')
+        exit(1)
+
+    runs = [measure(args.root, args.query) for i in range(args.runs)]
+
+    for name in ['import', 'query', 'wall']:
+        print(name + ': ' + str('{:.3f}'.format(statistics.median(r[name] for r in runs))) + 's')
+
+    heavy = sorted(set(m for r in runs for m in r['heavy']))
+    wall = statistics.median(r['wall'] for r in runs)
+
+    failed = False
+    if wall > args.budget:
+        print('FAIL: median wall time ' + str('{:.3f}'.format(wall)) + 's is over the budget of ' + str(args.budget) + 's')
+        failed = True
+    if heavy:
+        print('FAIL: query path imported ' + ', '.join(heavy))
+        failed = True
+
+    if failed:
+        exit(1)
+    print('OK')
+
+if __name__ == '__main__':
+    main()